@@ -0,0 +1,11 @@
+"""
+벤치마크 스크립트(bench_dico_bot.py, bench_fetcher.py)가 함께 쓰는 도우미.
+"""
+
+
+def percentile(samples, q: float) -> float:
+    """원본 측정값의 분위수 (최근접 순위 방식). 값이 없으면 0."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
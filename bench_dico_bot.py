@@ -0,0 +1,394 @@
+"""
+dico_bot.py 오프라인 부하 테스트.
+
+실제 Discord 길드나 OpenAI 키 없이 on_message / !say / play_tts_in_vc 경로를 돌려 봅니다.
+- 가짜 TTS 서버: 로컬 aiohttp 서버가 /v1/audio/speech 요청에 미리 만든 Ogg Opus 클립을 지연 시간을 두고 스트리밍합니다.
+- 재생 경로(create_audio_source, OggOpusAudio, ExactReader, iter_opus_packets)는 실제 코드를 그대로 씁니다.
+- 가짜 VoiceClient만 Discord 대신 Opus 패킷을 20ms 간격으로 읽어 재생한 것처럼 흉내 냅니다.
+
+예시:
+    python bench_dico_bot.py --scenario listen --guilds 4 --messages 200 --rate 20
+    python bench_dico_bot.py --scenario say --json --max-p99-ttfa 1.5   # CI에서 지연 시간 회귀 검사
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+from bench_common import percentile
+
+
+# --- 가짜 TTS 서버 ---
+
+FRAME_SECONDS = 0.02  # Discord는 20ms짜리 Opus 프레임을 보냄
+OPUS_SILENCE_FRAME = b"\xf8\xff\xfe"  # 20ms 무음 Opus 패킷 (discord.py가 재생 끝에 보내는 것과 같음)
+FRAMES_PER_PAGE = 50
+
+
+def _ogg_crc(data: bytes) -> int:
+    """Ogg 페이지 CRC (다항식 0x04c11db7, 반사 없음)."""
+    crc = 0
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+            crc &= 0xFFFFFFFF
+    return crc
+
+
+def _ogg_page(packets, granule: int, sequence: int, flags: int = 0, serial: int = 1) -> bytes:
+    segments = bytearray()
+    for packet in packets:
+        segments += b"\xff" * (len(packet) // 255) + bytes([len(packet) % 255])
+    header = b"OggS" + struct.pack("<BBqIIIB", 0, flags, granule, serial, sequence, 0, len(segments)) + segments
+    page = header + b"".join(packets)
+    return page[:22] + struct.pack("<I", _ogg_crc(page)) + page[26:]
+
+
+def clip_frames(seconds: float) -> int:
+    return max(1, round(seconds / FRAME_SECONDS))
+
+
+def make_ogg_opus(seconds: float) -> bytes:
+    """OpenAI가 response_format=opus로 돌려주는 것과 같은 형식의 Ogg Opus 클립 (무음 프레임)을 만듭니다."""
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+    vendor = b"bench_dico_bot"
+    tags = b"OpusTags" + struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", 0)
+    pages = [_ogg_page([head], 0, 0, flags=0x02), _ogg_page([tags], 0, 1)]
+    frames = clip_frames(seconds)
+    for start in range(0, frames, FRAMES_PER_PAGE):
+        count = min(FRAMES_PER_PAGE, frames - start)
+        last = start + count >= frames
+        pages.append(_ogg_page([OPUS_SILENCE_FRAME] * count, (start + count) * 960, len(pages),
+                               flags=0x04 if last else 0))
+    return b"".join(pages)
+
+
+def make_tts_app(args) -> web.Application:
+    audio = make_ogg_opus(args.audio_seconds)
+    chunk_size = max(1, len(audio) // args.chunks)
+
+    async def speech(request: web.Request) -> web.StreamResponse:
+        await request.read()
+        await asyncio.sleep(max(0.0, random.gauss(args.tts_latency, args.tts_jitter)))
+        if random.random() < args.error_rate:
+            return web.json_response({"error": {"message": "rate limited"}}, status=429)
+        response = web.StreamResponse(headers={"Content-Type": "audio/ogg"})
+        try:
+            await response.prepare(request)
+            for start in range(0, len(audio), chunk_size):
+                await response.write(audio[start:start + chunk_size])
+                await asyncio.sleep(args.chunk_interval)
+            await response.write_eof()
+        except ConnectionResetError:
+            pass  # 대기열에서 버려져 합성이 취소되면 클라이언트가 연결을 끊음 (aiohttp의 ClientConnectionResetError 포함)
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/audio/speech", speech)
+    return app
+
+
+# --- 가짜 Discord 객체 ---
+
+class FakeVoiceClient:
+    """
+    재생을 흉내 내는 VoiceClient. discord.py의 AudioPlayer처럼 오디오 스레드에서 소스의 Opus 패킷을 20ms마다 하나씩 읽고,
+    재생이 끝나면 읽은 패킷 수를 playbacks에 남깁니다 (중간에 stop()되면 None).
+    """
+
+    def __init__(self, guild, channel, playbacks: list):
+        self.guild = guild
+        self.channel = channel
+        self.playbacks = playbacks
+        self._connected = True
+        self._playing = False
+        self._stop = threading.Event()
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._playing
+
+    def play(self, source, *, after=None):
+        self._playing = True
+        self._stop.clear()
+
+        def run():
+            error = None
+            frames = 0
+            if not source.is_opus():
+                error = RuntimeError("Opus가 아닌 오디오 소스입니다. 실제 VoiceClient라면 PCM 인코딩이 필요합니다.")
+            started = time.monotonic()
+            while error is None and not self._stop.is_set():
+                data = source.read()
+                if not data:
+                    break
+                frames += 1
+                self._stop.wait(max(0.0, started + frames * FRAME_SECONDS - time.monotonic()))
+            self.playbacks.append(None if self._stop.is_set() else frames)
+            source.cleanup()
+            self._playing = False
+            if after is not None:
+                after(error)
+
+        threading.Thread(target=run, daemon=True, name="fake-voice-player").start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self):
+        self._connected = False
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, channel_id: int, args, playbacks: list):
+        self.guild = guild
+        self.id = channel_id
+        self.name = f"voice-{channel_id}"
+        self.args = args
+        self.playbacks = playbacks
+
+    async def connect(self):
+        await asyncio.sleep(self.args.connect_latency)
+        return FakeVoiceClient(self.guild, self, self.playbacks)
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.name = f"text-{channel_id}"
+
+    async def send(self, *args, **kwargs):
+        pass
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, args, playbacks: list):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.voice_channel = FakeVoiceChannel(self, guild_id * 10 + 1, args, playbacks)
+        self.text_channel = FakeTextChannel(guild_id * 10 + 2)
+        self.voice_channels = [self.voice_channel]
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: FakeGuild):
+        self.id = member_id
+        self.name = self.display_name = f"user{member_id}"
+        self.bot = False
+        self.guild = guild
+        self.voice = FakeVoiceState(guild.voice_channel)
+
+
+class FakeMessage:
+    def __init__(self, guild: FakeGuild, author: FakeMember, content: str):
+        self.guild = guild
+        self.channel = guild.text_channel
+        self.author = author
+        self.content = content
+
+
+class FakeContext:
+    def __init__(self, guild: FakeGuild, author: FakeMember):
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text_channel
+
+    async def send(self, *args, **kwargs):
+        pass
+
+
+# --- 부하 생성과 측정 ---
+
+def make_text(index: int, args) -> str:
+    if random.random() < args.repeat_ratio:
+        return random.choice(("안녕하세요!", "ㅋㅋㅋ", "좋아요.", "잠깐만요.", "다들 들어오세요."))
+    return f"{index}번째 테스트 메시지입니다. 부하 테스트용 문장을 조금 길게 만들어 봅니다."
+
+
+async def run_benchmark(args) -> dict:
+    import dico_bot  # 환경 변수 설정 후에 가져와야 함
+
+    # 버킷 추정치가 아닌 정확한 분위수를 위해 원본 측정값도 모음
+    samples = {stage: [] for stage in dico_bot.metrics.STAGES}
+    observe = dico_bot.metrics.observe
+
+    def recording_observe(stage, seconds):
+        samples[stage].append(seconds)
+        observe(stage, seconds)
+
+    dico_bot.metrics.observe = recording_observe
+
+    playbacks = []  # 재생마다 읽힌 Opus 패킷 수
+    guilds = [FakeGuild(guild_id, args, playbacks) for guild_id in range(1, args.guilds + 1)]
+    for guild in guilds:
+        dico_bot.guild_states.get(guild.id).listen_channel_ids.add(guild.text_channel.id)
+    members = {guild.id: [FakeMember(guild.id * 1000 + i, guild) for i in range(args.authors)] for guild in guilds}
+
+    depth_samples = []
+    sampling = True
+
+    async def sample_queue_depth():
+        while sampling:
+            depth_samples.append(sum(len(state.playback_queue) for state in dico_bot.guild_states
+                                     if state.playback_queue is not None))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.ensure_future(sample_queue_depth())
+    started = time.monotonic()
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    for index in range(args.messages):
+        guild = guilds[index % len(guilds)]
+        author = random.choice(members[guild.id])
+        text = make_text(index, args)
+        if args.scenario == "listen":
+            await dico_bot.on_message(FakeMessage(guild, author, text))
+        elif args.scenario == "say":
+            await dico_bot.say.callback(FakeContext(guild, author), text=text)
+        else:
+            state = dico_bot.guild_states.get(guild.id)
+            if not state.is_connected:
+                state.voice_client = await guild.voice_channel.connect()
+            await dico_bot.play_tts_in_vc(state.voice_client, text)
+        if interval:
+            await asyncio.sleep(interval)
+    send_done = time.monotonic()
+
+    # 묶기 대기 시간이 지나고 모든 대기열이 빌 때까지 기다림
+    deadline = send_done + args.drain_timeout
+    await asyncio.sleep(dico_bot.LISTEN_COALESCE_WINDOW + 0.05)
+    while time.monotonic() < deadline:
+        busy = any(state.playback_queue is not None and state.playback_queue.is_active
+                   for state in dico_bot.guild_states)
+        pending = any(coalescer.pending for state in dico_bot.guild_states for coalescer in state.coalescers.values())
+        if not busy and not pending:
+            break
+        await asyncio.sleep(0.05)
+    finished = time.monotonic()
+    sampling = False
+    await sampler
+
+    counters = dico_bot.metrics.counters
+    ttfa = samples["time_to_first_audio"]
+    expected_frames = clip_frames(args.audio_seconds)
+    completed = [frames for frames in playbacks if frames is not None]
+    return {
+        "scenario": args.scenario,
+        "guilds": args.guilds,
+        "messages": args.messages,
+        "send_seconds": send_done - started,
+        "total_seconds": finished - started,
+        "messages_per_sec": args.messages / (finished - started),
+        "utterances_played": len(samples["playback"]),
+        "ttfa_p50": percentile(ttfa, 0.50),
+        "ttfa_p95": percentile(ttfa, 0.95),
+        "ttfa_p99": percentile(ttfa, 0.99),
+        "ttfa_mean": statistics.fmean(ttfa) if ttfa else 0.0,
+        "synthesis_first_byte_p50": percentile(samples["synthesis_first_byte"], 0.50),
+        "queue_depth_max": max(depth_samples, default=0),
+        "queue_depth_mean": statistics.fmean(depth_samples) if depth_samples else 0.0,
+        "dropped": counters.get("queue_dropped", 0),
+        "shed": counters.get("queue_shed", 0),
+        "coalesced": counters.get("messages_coalesced", 0) + counters.get("queue_coalesced", 0),
+        "tts_api_requests": counters.get("tts_api_requests", 0),
+        "tts_failures": counters.get("tts_failures", 0),
+        "cache_hit_rate": dico_bot.tts_cache.stats()["hit_rate"],
+        "playback_errors": counters.get("playback_errors", 0),
+        # 끝까지 재생됐는데 클립의 패킷 수와 다르면 디코드/스트리밍 경로가 잘못된 것
+        "truncated_playbacks": sum(1 for frames in completed if frames != expected_frames),
+        "drained": finished < deadline,
+    }
+
+
+def print_report(result: dict):
+    print(f"\n--- dico_bot 부하 테스트 결과 ({result['scenario']}) ---")
+    print(f"길드 {result['guilds']}개, 메시지 {result['messages']}개, 재생된 발화 {result['utterances_played']}개")
+    print(f"처리량: {result['messages_per_sec']:.1f} msg/s (전송 {result['send_seconds']:.2f}초, 전체 {result['total_seconds']:.2f}초)")
+    print(f"첫 소리까지(TTFA): p50 {result['ttfa_p50'] * 1000:.0f}ms, p95 {result['ttfa_p95'] * 1000:.0f}ms, "
+          f"p99 {result['ttfa_p99'] * 1000:.0f}ms")
+    print(f"합성 첫 바이트 p50: {result['synthesis_first_byte_p50'] * 1000:.0f}ms")
+    print(f"대기열 깊이: 최대 {result['queue_depth_max']}, 평균 {result['queue_depth_mean']:.1f}")
+    print(f"버림 {result['dropped']}, 밀려서 정리 {result['shed']}, 묶임 {result['coalesced']}")
+    print(f"TTS API 요청 {result['tts_api_requests']}, 실패 {result['tts_failures']}, 캐시 적중률 {result['cache_hit_rate']:.1%}")
+    print(f"재생 오류 {result['playback_errors']}, 패킷이 모자라거나 남은 재생 {result['truncated_playbacks']}")
+    if not result["drained"]:
+        print("경고: 제한 시간 안에 대기열이 모두 비지 않았습니다.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="dico_bot 오프라인 부하 테스트")
+    parser.add_argument("--scenario", choices=("listen", "say", "direct"), default="listen",
+                        help="listen: on_message, say: !say 명령어, direct: play_tts_in_vc 직접 호출")
+    parser.add_argument("--guilds", type=int, default=2)
+    parser.add_argument("--authors", type=int, default=3, help="길드별 메시지 작성자 수")
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=10.0, help="초당 보낼 메시지 수 (0이면 한 번에)")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="자주 반복되는 문장의 비율 (캐시 효과 확인)")
+    parser.add_argument("--tts-latency", type=float, default=0.25, help="가짜 TTS 서버의 첫 바이트 지연(초)")
+    parser.add_argument("--tts-jitter", type=float, default=0.05)
+    parser.add_argument("--chunks", type=int, default=4, help="응답 본문을 나눠 보낼 조각 수")
+    parser.add_argument("--chunk-interval", type=float, default=0.02, help="조각 사이 지연(초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429를 돌려줄 확률")
+    parser.add_argument("--audio-seconds", type=float, default=0.5, help="발화 하나의 오디오 길이(초)")
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="가짜 음성 채널 연결 지연(초)")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    parser.add_argument("--max-p99-ttfa", type=float, default=None,
+                        help="TTFA p99가 이 값(초)을 넘거나 메시지가 버려지거나 재생이 잘못되면 종료 코드 1 (CI용)")
+    return parser.parse_args(argv)
+
+
+async def main(args) -> dict:
+    runner = web.AppRunner(make_tts_app(args))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    state_dir = tempfile.mkdtemp(prefix="dico_bot_bench_")
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "TTS_CACHE_DISK_BYTES": "0",
+        "TTS_RESPONSE_FORMAT": "opus",  # FFmpeg 없이 실제 OggOpusAudio 경로로 재생
+        "BOT_STATE_PATH": os.path.join(state_dir, "bot_state.json"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    os.environ.pop("METRICS_DUMP_PATH", None)
+    try:
+        return await run_benchmark(args)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(args.seed)
+    result = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+    if args.max_p99_ttfa is not None and (result["ttfa_p99"] > args.max_p99_ttfa or result["dropped"] or not result["drained"]
+                                          or result["playback_errors"] or result["truncated_playbacks"]):
+        sys.exit(1)
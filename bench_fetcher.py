@@ -0,0 +1,238 @@
+"""
+new.py AsyncDataFetcher 벤치마크.
+
+로컬 aiohttp 서버를 별도 프로세스로 띄우고, max_concurrent_requests를 바꿔 가며 같은 요청 수를 보내
+처리량(req/s)과 지연 시간(p50/p99)을 비교합니다.
+- 가짜 API 서버: 요청마다 지연 시간(정규분포)을 두고, 정해진 크기의 JSON을 돌려주며, 일정 비율로 에러를 냅니다.
+  --slow-rate를 주면 그 비율의 요청은 --slow-latency만큼 늦게 답해 꼬리 지연을 만듭니다 (--hedge-after 효과 확인용).
+- 지연 시간은 결과의 timings에서 큐 대기를 뺀 값(재시도 포함)이며, 히스토그램 추정치가 아닌 원본 값으로 계산합니다.
+  큐 대기는 동시 요청 수가 작을수록 길어지므로 따로 보여 줍니다.
+
+예시:
+    python bench_fetcher.py --concurrency 1,4,16,64 --requests 1000 --latency 0.05
+    python bench_fetcher.py --payload-bytes 1000000 --error-rate 0.05 --plot fetcher.png
+    python bench_fetcher.py --json --max-p99 0.5   # CI에서 지연 시간 회귀 검사
+    python bench_fetcher.py --concurrency 4 --slow-rate 0.05 --slow-latency 2 --hedge-after 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import statistics
+import sys
+import time
+
+from aiohttp import web
+
+from bench_common import percentile
+from new import AsyncDataFetcher, RetryPolicy
+
+
+# --- 가짜 API 서버 ---
+
+def make_api_app(args) -> web.Application:
+    item = {"id": 0, "title": "benchmark", "body": ""}
+    padding = max(0, args.payload_bytes - len(json.dumps(item)))
+    item["body"] = "x" * padding
+    payload = json.dumps(item).encode()
+
+    async def get_item(request: web.Request) -> web.Response:
+        if random.random() < args.slow_rate:
+            await asyncio.sleep(args.slow_latency)
+        else:
+            await asyncio.sleep(max(0.0, random.gauss(args.latency, args.jitter)))
+        if random.random() < args.error_rate:
+            headers = {"Retry-After": "0"} if args.error_status in (429, 503) else None
+            return web.json_response({"error": "injected"}, status=args.error_status, headers=headers)
+        return web.Response(body=payload, content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/items/{id}", get_item)
+    return app
+
+
+def serve(args, port_queue):
+    """서버 프로세스의 진입점. 빈 포트를 잡아 부모에게 알려 주고 종료될 때까지 응답합니다."""
+    random.seed(args.seed)
+
+    async def main():
+        runner = web.AppRunner(make_api_app(args), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0, backlog=1024)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+# --- 부하 생성과 측정 ---
+
+async def run_level(concurrency: int, port: int, args) -> dict:
+    """동시 요청 수 하나에 대해 args.requests개의 요청을 보내고 결과를 요약합니다."""
+    urls = [f"http://127.0.0.1:{port}/items/{concurrency}-{i}" for i in range(args.requests)]
+    fetcher = AsyncDataFetcher(
+        urls,
+        concurrency,
+        # 서버가 하나뿐이므로 호스트별 한도가 병목이 되지 않게 전역 한도와 맞춤
+        per_host_limit=concurrency,
+        adaptive=False,
+        retry_policy=RetryPolicy(max_attempts=args.max_attempts, base_delay=0.05),
+        hedge_after=args.hedge_after,
+        raw=args.raw,
+        log_sample_rate=0,
+    )
+    latencies = []
+    queue_waits = []
+    hedged = 0
+    started = time.monotonic()
+    async for result in fetcher.stream():
+        timings = result["timings"]
+        latencies.append(timings["total"] - timings["queue_wait"])
+        queue_waits.append(timings["queue_wait"])
+        hedged += result["hedged"]
+    elapsed = time.monotonic() - started
+
+    stages = fetcher.metrics.histograms
+    return {
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "succeeded": len(latencies),
+        "failed": args.requests - len(latencies),
+        "retries": fetcher.metrics.counters.get("retries", 0),
+        "hedged": hedged,
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+        "queue_wait_p50": percentile(queue_waits, 0.50),
+        # 단계별 값은 히스토그램 추정치
+        "ttfb_p50": stages["ttfb"].quantile(0.5),
+        "parse_p50": stages["parse"].quantile(0.5),
+        "bytes_total": int(fetcher.metrics.sizes.sum),
+    }
+
+
+async def run_benchmark(args, port: int) -> dict:
+    levels = []
+    for concurrency in args.concurrency:
+        levels.append(await run_level(concurrency, port, args))
+    return {
+        "latency": args.latency,
+        "payload_bytes": args.payload_bytes,
+        "error_rate": args.error_rate,
+        "hedge_after": args.hedge_after,
+        "raw": args.raw,
+        "levels": levels,
+    }
+
+
+# --- 출력 ---
+
+def print_report(result: dict, width: int = 40):
+    levels = result["levels"]
+    print(f"\n--- AsyncDataFetcher 벤치마크 (서버 지연 {result['latency'] * 1000:.0f}ms, "
+          f"응답 {result['payload_bytes']}B, 에러율 {result['error_rate']:.0%}) ---")
+    print(f"{'conc':>5} | {'req/s':>8} | {'p50 ms':>8} | {'p99 ms':>8} | {'fail':>5} | {'retry':>5} | {'hedge':>5} | "
+          f"{'queue p50 ms':>12} | parse p50 ms")
+    for level in levels:
+        print(f"{level['concurrency']:>5} | {level['requests_per_sec']:>8.1f} | {level['latency_p50'] * 1000:>8.1f} | "
+              f"{level['latency_p99'] * 1000:>8.1f} | {level['failed']:>5} | {level['retries']:>5} | {level['hedged']:>5} | "
+              f"{level['queue_wait_p50'] * 1000:>12.1f} | {level['parse_p50'] * 1000:.3f}")
+
+    max_rps = max((level["requests_per_sec"] for level in levels), default=0.0) or 1.0
+    print("\n처리량 (req/s)")
+    for level in levels:
+        bar = "█" * round(width * level["requests_per_sec"] / max_rps)
+        print(f"{level['concurrency']:>5} | {bar} {level['requests_per_sec']:.1f}")
+
+    max_p99 = max((level["latency_p99"] for level in levels), default=0.0) or 1.0
+    print("\n요청 지연 시간, 큐 대기 제외 (█ p50, ░ p99까지)")
+    for level in levels:
+        p50 = round(width * level["latency_p50"] / max_p99)
+        p99 = round(width * level["latency_p99"] / max_p99)
+        print(f"{level['concurrency']:>5} | {'█' * p50}{'░' * max(0, p99 - p50)} "
+              f"{level['latency_p50'] * 1000:.0f} / {level['latency_p99'] * 1000:.0f}ms")
+
+
+def save_plot(result: dict, path: str):
+    """matplotlib이 있으면 처리량과 p50/p99를 그래프 파일로 저장합니다."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("그래프를 저장하려면 matplotlib이 필요합니다. 'pip install matplotlib' 명령어로 설치해주세요.")
+        return
+    levels = result["levels"]
+    concurrency = [level["concurrency"] for level in levels]
+    fig, throughput_ax = plt.subplots(figsize=(8, 5))
+    throughput_ax.plot(concurrency, [level["requests_per_sec"] for level in levels], "o-", color="tab:blue")
+    throughput_ax.set_xscale("log", base=2)
+    throughput_ax.set_xlabel("max_concurrent_requests")
+    throughput_ax.set_ylabel("requests/sec", color="tab:blue")
+    latency_ax = throughput_ax.twinx()
+    latency_ax.plot(concurrency, [level["latency_p50"] * 1000 for level in levels], "s--", color="tab:orange", label="p50")
+    latency_ax.plot(concurrency, [level["latency_p99"] * 1000 for level in levels], "^--", color="tab:red", label="p99")
+    latency_ax.set_ylabel("latency (ms)")
+    latency_ax.legend(loc="upper left")
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"그래프 저장: {path}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AsyncDataFetcher 벤치마크")
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")],
+                        default=[1, 2, 4, 8, 16, 32, 64], help="쉼표로 구분한 max_concurrent_requests 값들")
+    parser.add_argument("--requests", type=int, default=500, help="동시 요청 수마다 보낼 요청 수")
+    parser.add_argument("--latency", type=float, default=0.05, help="가짜 서버의 응답 지연(초)")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--payload-bytes", type=int, default=4096, help="응답 JSON 크기")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="에러를 돌려줄 확률")
+    parser.add_argument("--error-status", type=int, default=503, help="에러 응답의 상태 코드")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="느리게 답할 요청의 비율 (꼬리 지연)")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="느린 요청의 응답 지연(초)")
+    parser.add_argument("--hedge-after", type=float, default=None, help="AsyncDataFetcher의 hedge_after (초)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="요청당 최대 시도 횟수")
+    parser.add_argument("--raw", action="store_true", help="JSON 디코딩 없이 본문 바이트만 받음")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--plot", default=None, help="처리량/지연 시간 그래프를 저장할 경로 (matplotlib 필요)")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    parser.add_argument("--max-p99", type=float, default=None,
+                        help="어느 동시 요청 수에서든 p99가 이 값(초)을 넘거나 실패가 있으면 종료 코드 1 (CI용)")
+    return parser.parse_args(argv)
+
+
+async def main(args, port: int) -> dict:
+    return await run_benchmark(args, port)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(args.seed)
+    logging.getLogger().setLevel(logging.ERROR)  # 재시도 경고는 표의 retry 수로 대신
+
+    # 서버가 벤치마크 대상과 같은 이벤트 루프를 나눠 쓰지 않도록 별도 프로세스에서 실행
+    ctx = multiprocessing.get_context("spawn")
+    port_queue = ctx.Queue()
+    server = ctx.Process(target=serve, args=(args, port_queue), daemon=True, name="bench-api-server")
+    server.start()
+    try:
+        result = asyncio.run(main(args, port_queue.get(timeout=30)))
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+    if args.plot:
+        save_plot(result, args.plot)
+    if args.max_p99 is not None and any(level["latency_p99"] > args.max_p99 or level["failed"]
+                                        for level in result["levels"]):
+        sys.exit(1)
@@ -2,139 +2,1283 @@ import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+import openai
+import httpx
 import asyncio
+import random
+import time
+import re
+import itertools
+import bisect
+import contextlib
+import logging
+import subprocess
 import tempfile
+import io
 import shutil # shutil 임포트 추가
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, deque
 
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# OpenAI TTS 요청 설정 (.env에서 변경 가능)
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", 16)) # 프로세스 전체 동시 합성 요청 수
+TTS_GUILD_CONCURRENCY = int(os.getenv("TTS_GUILD_CONCURRENCY", 2)) # 길드별 동시 합성 요청 수
+TTS_MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", 3)) # 429/5xx/연결 오류 시 재시도 횟수
+TTS_REQUEST_TIMEOUT = float(os.getenv("TTS_REQUEST_TIMEOUT", 15)) # 요청 1회의 제한 시간(초)
+TTS_DEADLINE = float(os.getenv("TTS_DEADLINE", 30)) # 재시도를 포함한 합성 전체의 제한 시간(초)
+
 # Initialize OpenAI client
-client = OpenAI()
+# 비동기 클라이언트 하나가 keep-alive 커넥션 풀을 공유하므로 합성 요청마다 스레드를 쓰지 않습니다.
+# 재시도는 synthesize_tts에서 직접 처리하므로 클라이언트 자체 재시도는 끕니다.
+client = openai.AsyncOpenAI(
+    max_retries=0,
+    timeout=TTS_REQUEST_TIMEOUT,
+    http_client=openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=TTS_MAX_CONCURRENCY,
+            max_keepalive_connections=TTS_MAX_CONCURRENCY,
+            keepalive_expiry=60,
+        ),
+    ),
+)
 if OPENAI_API_KEY:
     client.api_key = OPENAI_API_KEY
 else:
     print("경고: OPENAI_API_KEY가 .env 파일에 설정되지 않았습니다. TTS 기능이 제한될 수 있습니다.")
 
+# 로깅 설정 (LOG_LEVEL로 레벨 조정, 메시지마다 찍히는 로그는 LOG_SAMPLE_RATE 비율만 남김)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+)
+log = logging.getLogger("dico_bot")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH") # 설정하면 Prometheus 텍스트 형식으로 주기적으로 저장
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", 15))
+
+
+def log_sampled(level: int, msg: str, *args):
+    """메시지마다 호출되는 핫 패스용 로그. 레벨이 꺼져 있으면 문자열 포매팅도 하지 않습니다."""
+    if log.isEnabledFor(level) and (LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE):
+        log.log(level, msg, *args)
+
+
+class LatencyHistogram:
+    """Prometheus 방식의 누적 버킷 히스토그램. observe는 bisect 한 번과 덧셈뿐이라 핫 패스에서 써도 됩니다."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.35, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # 마지막 칸은 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()  # 오디오 스레드에서도 observe하므로 필요
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """버킷 안에서 선형 보간한 분위수 추정치. 관측값이 없으면 0."""
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+        if count == 0:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.BUCKETS[index - 1] if index > 0 else 0.0
+                upper = self.BUCKETS[index] if index < len(self.BUCKETS) else self.BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.BUCKETS[-1]
+
+
+class PipelineMetrics:
+    """메시지 수신부터 재생까지 TTS 파이프라인 단계별 지연 시간과 카운터."""
+
+    STAGES = {
+        "voice_connect": "음성 채널 연결/이동",
+        "synthesis_first_byte": "OpenAI 합성 첫 바이트",
+        "synthesis_total": "OpenAI 합성 전체",
+        "pipe_setup": "오디오 파이프/FFmpeg 준비",
+        "ffmpeg_first_packet": "재생 시작부터 첫 패킷",
+        "time_to_first_audio": "메시지 수신부터 첫 소리",
+        "playback": "재생 시간",
+    }
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.counters = {}
+        self._lock = threading.Lock()  # 오디오 스레드(after 콜백)와 FFmpeg 보충 스레드에서도 incr하므로 필요
+
+    def observe(self, stage: str, seconds: float):
+        self.histograms[stage].observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _all_counters(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        cache_stats = tts_cache.stats()
+        for key in ("memory_hits", "disk_hits", "misses", "evictions"):
+            counters[f"tts_cache_{key}"] = cache_stats[key]
+        return counters
+
+    def render_text(self) -> str:
+        lines = ["TTS 파이프라인 통계 (p50 / p95 / p99, 횟수)"]
+        for stage, label in self.STAGES.items():
+            histogram = self.histograms[stage]
+            if histogram.count:
+                lines.append(
+                    f"- {label}: {histogram.quantile(0.5) * 1000:.0f} / {histogram.quantile(0.95) * 1000:.0f} / "
+                    f"{histogram.quantile(0.99) * 1000:.0f}ms ({histogram.count}회)"
+                )
+        for name, value in sorted(self._all_counters().items()):
+            lines.append(f"- {name}: {value}")
+        return "\n".join(lines)
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP dico_bot_stage_seconds TTS pipeline stage latency.",
+            "# TYPE dico_bot_stage_seconds histogram",
+        ]
+        for stage, histogram in self.histograms.items():
+            with histogram._lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.BUCKETS + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'dico_bot_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'dico_bot_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'dico_bot_stage_seconds_count{{stage="{stage}"}} {count}')
+        for name, value in sorted(self._all_counters().items()):
+            lines.append(f"# TYPE dico_bot_{name}_total counter")
+            lines.append(f"dico_bot_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = PipelineMetrics()
+
+
+class InstrumentedAudioSource(discord.AudioSource):
+    """첫 패킷이 읽히는 시점을 기록하기 위해 오디오 소스를 감쌉니다. read는 오디오 스레드에서 호출됩니다."""
+
+    def __init__(self, source: discord.AudioSource, on_first_packet):
+        self.source = source
+        self.on_first_packet = on_first_packet
+
+    def read(self) -> bytes:
+        data = self.source.read()
+        if data and self.on_first_packet is not None:
+            callback, self.on_first_packet = self.on_first_packet, None
+            callback()
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
 # Define Intents
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
 # Define Bot instance
-bot = commands.Bot(command_prefix="!", intents=intents)
+# 길드 수가 많아지면 discord.py가 샤드를 자동으로 나누도록 AutoShardedBot 사용
+bot = commands.AutoShardedBot(command_prefix="!", intents=intents)
 
-# 전역 변수
-current_vc = None  # 현재 연결된 음성 클라이언트
-listening_text_channel_id = None # 봇이 메시지를 읽을 텍스트 채널 ID
+# 전역 설정 (길드별 상태는 guild_states에서 관리)
 ffmpeg_executable_path = "ffmpeg" # FFmpeg 실행 파일 이름 또는 전체 경로
 AVAILABLE_VOICES = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
-current_tts_voice = "alloy" # 기본 목소리
+DEFAULT_TTS_VOICE = "alloy" # 기본 목소리
+BOT_STATE_PATH = os.getenv("BOT_STATE_PATH", "bot_state.json") # 길드별 설정을 저장할 파일
+TTS_MODEL = "tts-1"
+# OpenAI에 요청할 오디오 형식. opus면 Discord로 보낼 때 재인코딩 없이 Opus 패킷을 그대로 사용합니다.
+TTS_RESPONSE_FORMAT = os.getenv("TTS_RESPONSE_FORMAT", "opus")
+# opus가 아닌 형식을 변환할 때 미리 띄워 둘 FFmpeg 프로세스 수와 최대 대기 시간(초)
+TTS_FFMPEG_POOL_SIZE = int(os.getenv("TTS_FFMPEG_POOL_SIZE", 2))
 
-async def play_tts_in_vc(vc: discord.VoiceClient, text_to_say: str, ctx_for_feedback=None):
-    """지정된 음성 클라이언트에서 TTS를 재생합니다."""
-    if not vc or not vc.is_connected():
-        feedback_message = "봇이 음성 채널에 연결되어 있지 않습니다."
-        # ctx_for_feedback이 Messageable 객체인지 확인 (TextChannel, User, Member 등)
-        if hasattr(ctx_for_feedback, 'send'): await ctx_for_feedback.send(feedback_message)
-        else: print(feedback_message)
-        return False
+# 재생 대기열 설정 (.env에서 변경 가능)
+TTS_QUEUE_MAX_DEPTH = int(os.getenv("TTS_QUEUE_MAX_DEPTH", 10)) # 길드별 최대 대기 메시지 수
+TTS_QUEUE_OVERFLOW = os.getenv("TTS_QUEUE_OVERFLOW", "drop_oldest") # drop_oldest, drop_newest, coalesce
+TTS_PREFETCH = int(os.getenv("TTS_PREFETCH", 2)) # 재생 중에 미리 합성해 둘 문장 조각 수
 
-    if vc.is_playing():
-        feedback_message = "이미 다른 내용을 말하고 있어요. 잠시 후 다시 시도해주세요."
-        if hasattr(ctx_for_feedback, 'send'): await ctx_for_feedback.send(feedback_message)
-        else: print(feedback_message)
-        return False
+# 리스닝 채널 메시지 묶기 설정 (.env에서 변경 가능)
+LISTEN_COALESCE_WINDOW = float(os.getenv("LISTEN_COALESCE_WINDOW", 0.8)) # 이 시간(초) 안에 온 메시지를 한 번에 읽음
+LISTEN_AUTHOR_PREFIX = os.getenv("LISTEN_AUTHOR_PREFIX", "on_change") # none, always, on_change(말하는 사람이 바뀔 때만)
+LISTEN_MAX_LAG = float(os.getenv("LISTEN_MAX_LAG", 30)) # 대기열이 이 시간(초) 이상 밀리면 오래된 메시지를 정리
+LISTEN_LAG_POLICY = os.getenv("LISTEN_LAG_POLICY", "summarize") # drop(조용히 버림), summarize(건너뛴 개수를 읽어줌)
 
-    if hasattr(ctx_for_feedback, 'send'):
-        # f-string 따옴표 수정
-        await ctx_for_feedback.send(f'잠시만 기다려주세요: "{text_to_say}"')
+# 긴 메시지 분할 설정 (.env에서 변경 가능)
+TTS_FIRST_CHUNK_MAX_CHARS = int(os.getenv("TTS_FIRST_CHUNK_MAX_CHARS", 60)) # 첫 조각은 짧게 해서 첫 소리를 빨리 냄
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", 200))
+# overflow 정책이 coalesce일 때 합쳐진 요청 하나의 최대 길이. 넘으면 drop_oldest처럼 처리
+TTS_COALESCE_MAX_CHARS = int(os.getenv("TTS_COALESCE_MAX_CHARS", TTS_CHUNK_MAX_CHARS * 4))
+# 문장 경계: 마침표/물음표/느낌표/말줄임표/물결 뒤 공백, 전각 구두점 뒤, 줄바꿈
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?…~])\s+|(?<=[。！？])\s*|\n+")
+# 절 경계: 쉼표/세미콜론/콜론 (숫자 "1,000"을 자르지 않도록 반각은 뒤에 공백이 있을 때만)
+CLAUSE_BOUNDARY_RE = re.compile(r"(?<=[,;:])\s+|(?<=[，、；：])\s*")
+
+# TTS 오디오 캐시 설정 (.env에서 변경 가능)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dico_bot_tts_cache"))
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 32 * 1024 * 1024))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+
+
+class TTSAudioCache:
+    """
+    (모델, 목소리, 정규화된 텍스트)를 키로 하는 2단계 TTS 오디오 캐시.
+    1단계는 메모리 LRU, 2단계는 디스크 저장소이며 둘 다 바이트 예산을 넘으면 오래된 항목부터 제거합니다.
+    """
+
+    # 디스크 예산을 넘으면 이 비율까지 줄여 둠. 가득 찬 뒤에도 put마다 디렉터리 전체를 다시 훑지 않도록
+    DISK_EVICT_TARGET = 0.9
 
-    def tts_sync():
+    def __init__(self, cache_dir: str, memory_budget: int, disk_budget: int):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._memory = OrderedDict()  # key -> bytes (마지막이 가장 최근 사용)
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()  # run_in_executor 스레드에서도 호출되므로 필요
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_budget > 0:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """공백/유니코드 표기 차이로 같은 문장이 다른 키가 되지 않도록 정규화합니다."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def make_key(self, model: str, voice: str, text: str, audio_format: str = "mp3") -> str:
+        raw = "\0".join((model, voice, audio_format, self.normalize_text(text)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".audio")
+
+    def _disk_entries(self):
+        """(경로, 마지막 사용 시각, 크기) 목록을 돌려줍니다."""
+        entries = []
         try:
-            response = client.audio.speech.create(
-                model="tts-1", voice=current_tts_voice, input=text_to_say
-            )
-            return response.content
-        except Exception as e:
-            print(f"OpenAI TTS API 오류: {e}")
-            return None
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".audio"):
+                        st = entry.stat()
+                        entries.append((entry.path, st.st_mtime, st.st_size))
+        except FileNotFoundError:
+            pass
+        return entries
 
-    audio_content = await bot.loop.run_in_executor(None, tts_sync)
+    def _remember(self, key: str, audio: bytes):
+        """메모리 LRU에 넣고 예산을 넘으면 가장 오래 안 쓴 항목을 제거합니다. (lock 보유 상태에서 호출)"""
+        if len(audio) > self.memory_budget:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def get_from_memory(self, key: str):
+        """메모리 LRU만 조회합니다. 없으면 None (실패로 세지 않음). 이벤트 루프에서 바로 호출해도 됩니다."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return audio
+
+    def get(self, key: str):
+        """캐시된 오디오 바이트를 돌려주고, 없으면 None. 디스크 조회가 있으므로 이벤트 루프 밖에서 호출하세요."""
+        audio = self.get_from_memory(key)
+        if audio is not None:
+            return audio
+        if self.disk_budget > 0:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)  # 디스크 LRU 순서를 위해 사용 시각 갱신
+            except OSError:
+                audio = None
+            if audio:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, audio)
+                return audio
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        with self._lock:
+            self._remember(key, audio)
+        if self.disk_budget <= 0 or len(audio) > self.disk_budget:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)  # 읽는 쪽이 반쯤 쓰인 파일을 보지 않도록 원자적으로 교체
+        except OSError as e:
+            log.warning("TTS 캐시 파일 저장 중 오류: %s", e)
+            return
+        with self._lock:
+            self._disk_bytes += len(audio)
+            over_budget = self._disk_bytes > self.disk_budget
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """오래 안 쓴 파일부터 지워 디스크 사용량을 예산의 DISK_EVICT_TARGET 비율까지 줄입니다."""
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        if total <= self.disk_budget:
+            with self._lock:
+                self._disk_bytes = total
+            return
+        target = int(self.disk_budget * self.DISK_EVICT_TARGET)
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+tts_cache = TTSAudioCache(TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DISK_BYTES)
+
+async def send_feedback(ctx_for_feedback, feedback_message: str):
+    """ctx_for_feedback이 Messageable 객체(TextChannel, User, Member 등)면 메시지를 보내고, 아니면 콘솔에 출력합니다."""
+    if hasattr(ctx_for_feedback, 'send'):
+        try:
+            await ctx_for_feedback.send(feedback_message)
+        except discord.HTTPException as e:
+            log.warning("피드백 메시지 전송 중 오류: %s", e)
+    else:
+        log.info(feedback_message)
+
+
+tts_semaphore = asyncio.Semaphore(TTS_MAX_CONCURRENCY) # 프로세스 전체 동시 합성 제한
+
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    """재시도 전 대기 시간. Retry-After 헤더가 있으면 따르고, 없으면 full jitter 지수 백오프를 씁니다."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), 10.0)
+            except ValueError:
+                pass
+    return random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+
+
+# 스트리밍 중 끊긴 연결(httpx 예외)도 아직 받은 데이터가 없으면 재시도
+RETRYABLE_TTS_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError, httpx.TransportError)
+
+
+def split_tts_text(text: str, first_max_chars: int = None, max_chars: int = None) -> list:
+    """
+    긴 메시지를 문장/절 단위로 나눕니다.
+    첫 조각은 first_max_chars 이하로 짧게 잘라 첫 소리가 빨리 나오게 하고,
+    나머지는 max_chars까지 문장을 묶어 API 호출 수를 줄입니다.
+    """
+    first_max_chars = first_max_chars or TTS_FIRST_CHUNK_MAX_CHARS
+    max_chars = max_chars or TTS_CHUNK_MAX_CHARS
+
+    pieces = []
+    for sentence in SENTENCE_BOUNDARY_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= first_max_chars:
+            pieces.append(sentence)
+            continue
+        # 너무 긴 문장은 쉼표 등 절 경계에서, 그래도 길면 공백에서 자름 (첫 조각은 first_max_chars 기준)
+        for clause in CLAUSE_BOUNDARY_RE.split(sentence):
+            clause = clause.strip()
+            limit = max_chars if pieces else first_max_chars
+            while len(clause) > limit:
+                cut = clause.rfind(" ", 0, limit)
+                if cut <= 0:
+                    cut = limit
+                pieces.append(clause[:cut].strip())
+                clause = clause[cut:].strip()
+                limit = max_chars
+            if clause:
+                pieces.append(clause)
+
+    chunks = []
+    for piece in pieces:
+        limit = first_max_chars if len(chunks) == 1 else max_chars
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= limit:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+class AudioStreamBuffer:
+    """
+    스트리밍으로 받는 TTS 오디오를 FFmpeg 파이프 쓰기 스레드에 넘겨주는 버퍼.
+    이벤트 루프에서 feed/finish로 채우고, 오디오 스레드에서 read로 꺼내 갑니다.
+    """
+
+    def __init__(self):
+        self._chunks = deque()
+        self._parts = []  # 캐시 저장용 전체 데이터
+        self._cond = threading.Condition()
+        self._closed = False
+        self.failed = False
+        self.first_data_at = None  # 첫 데이터가 들어온 time.monotonic() 값
+        self._ready = asyncio.get_running_loop().create_future()
+
+    @property
+    def has_data(self) -> bool:
+        return bool(self._parts)
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        if self.first_data_at is None:
+            self.first_data_at = time.monotonic()
+        self._parts.append(data)
+        with self._cond:
+            self._chunks.append(data)
+            self._cond.notify_all()
+        if not self._ready.done():
+            self._ready.set_result(True)
+
+    def finish(self, failed: bool = False):
+        """더 이상 데이터가 없음을 알립니다. 여러 번 호출해도 됩니다."""
+        if failed and not self._closed:
+            self.failed = True
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if not self._ready.done():
+            self._ready.set_result(self.has_data)
+
+    async def wait_ready(self) -> bool:
+        """첫 데이터가 들어오거나 실패할 때까지 기다립니다. 재생할 데이터가 있으면 True."""
+        return await asyncio.shield(self._ready)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._parts)
+
+    def read(self, size: int = -1) -> bytes:
+        """데이터가 들어올 때까지 블로킹합니다. 끝나면 b''를 돌려줍니다. (이벤트 루프에서 호출 금지)"""
+        with self._cond:
+            while not self._chunks and not self._closed:
+                self._cond.wait()
+            if not self._chunks:
+                return b""
+            data = self._chunks.popleft()
+            if 0 <= size < len(data):
+                self._chunks.appendleft(data[size:])
+                data = data[:size]
+            return data
+
+
+async def stream_speech(text_to_say: str, voice: str, deadline: float, buffer: AudioStreamBuffer):
+    """
+    OpenAI TTS 응답 본문을 받는 대로 buffer에 넣습니다.
+    429/5xx/연결 오류는 아직 받은 데이터가 없을 때만 deadline(loop.time() 기준) 안에서 재시도합니다.
+    """
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError("TTS 합성 제한 시간을 넘었습니다.")
+        try:
+            async with client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL, voice=voice, input=text_to_say, response_format=TTS_RESPONSE_FORMAT,
+                timeout=min(TTS_REQUEST_TIMEOUT, remaining),
+            ) as response:
+                async for chunk in response.iter_bytes():
+                    buffer.feed(chunk)
+            return
+        except RETRYABLE_TTS_ERRORS as e:
+            # APITimeoutError는 APIConnectionError의 하위 클래스
+            if buffer.has_data or attempt >= TTS_MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt, e)
+            if loop.time() + delay >= deadline:
+                raise
+            attempt += 1
+            metrics.incr("tts_retries")
+            log.warning("OpenAI TTS API 오류, %.2f초 후 재시도 (%d/%d): %s", delay, attempt, TTS_MAX_RETRIES, e)
+            await asyncio.sleep(delay)
 
-    if not audio_content:
-        feedback_message = "TTS 오디오를 생성하는 데 실패했습니다."
-        if hasattr(ctx_for_feedback, 'send'): await ctx_for_feedback.send(feedback_message)
-        else: print(feedback_message)
-        return False
 
-    filename = None
-    play_success = False
+async def synthesize_tts(text_to_say: str, voice: str, guild_id: int = None, buffer: AudioStreamBuffer = None) -> bool:
+    """텍스트를 TTS 오디오로 변환해 buffer에 스트리밍합니다. 실패하면 False를 돌려줍니다."""
+    loop = asyncio.get_running_loop()
+    cache_key = tts_cache.make_key(TTS_MODEL, voice, text_to_say, TTS_RESPONSE_FORMAT)
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-            f.write(audio_content)
-            filename = f.name
-        
-        if not os.path.exists(filename):
-            feedback_message = "오디오 파일 생성에 실패했습니다 (파일 없음)."
-            if hasattr(ctx_for_feedback, 'send'): await ctx_for_feedback.send(feedback_message)
-            else: print(feedback_message)
+        # 캐시에 있으면 OpenAI 호출을 생략 (디스크 조회만 executor에서)
+        cached = tts_cache.get_from_memory(cache_key)
+        if cached is None:
+            cached = await loop.run_in_executor(None, tts_cache.get, cache_key)
+        if cached is not None:
+            buffer.feed(cached)
+            buffer.finish()
+            return True
+
+        started = time.monotonic()
+        deadline = loop.time() + TTS_DEADLINE
+        guild_semaphore = guild_states.get(guild_id).tts_semaphore if guild_id is not None else None
+        try:
+            # 한 길드가 전체 동시 요청 슬롯을 독차지하지 못하도록 길드 제한을 먼저 잡음
+            if guild_semaphore is not None:
+                await asyncio.wait_for(guild_semaphore.acquire(), deadline - loop.time())
+            try:
+                async with tts_semaphore:
+                    await stream_speech(text_to_say, voice, deadline, buffer)
+            finally:
+                if guild_semaphore is not None:
+                    guild_semaphore.release()
+        except asyncio.TimeoutError:
+            metrics.incr("tts_failures")
+            log.error("OpenAI TTS 합성 제한 시간(%s초)을 넘었습니다.", TTS_DEADLINE)
             return False
-        
-        source = discord.FFmpegPCMAudio(filename, executable=ffmpeg_executable_path)
-        
-        # 재생 완료 후 파일 삭제를 위한 콜백 함수
-        def after_playing(error):
-            if error:
-                print(f'재생 오류: {error}')
-            else:
-                print('재생 완료.')
-            # 파일을 삭제하기 전에 asyncio.create_task를 사용하여 비동기적으로 처리
-            # 또는 bot.loop.call_soon_threadsafe 사용 고려
-            # 여기서는 간단히 os.remove를 시도하지만, 권한 문제가 발생할 수 있음
-            if filename and os.path.exists(filename):
+        except (openai.OpenAIError, httpx.HTTPError) as e:
+            metrics.incr("tts_failures")
+            log.error("OpenAI TTS API 오류: %s", e)
+            return False
+
+        buffer.finish()
+        metrics.incr("tts_api_requests")
+        if buffer.first_data_at is not None:
+            metrics.observe("synthesis_first_byte", buffer.first_data_at - started)
+        metrics.observe("synthesis_total", time.monotonic() - started)
+        # 디스크 저장은 재생을 늦추지 않도록 기다리지 않음
+        loop.run_in_executor(None, tts_cache.put, cache_key, buffer.getvalue())
+        return True
+    finally:
+        # 실패/취소 시에도 FFmpeg 쓰기 스레드가 read에서 영원히 기다리지 않도록 닫음
+        buffer.finish(failed=True)
+
+
+class ExactReader:
+    """read(n)이 n바이트(또는 스트림 끝)까지 채워서 돌려주도록 감쌉니다. OggStream은 짧은 read를 처리하지 못합니다."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size: int) -> bytes:
+        parts = []
+        remaining = size
+        while remaining > 0:
+            data = self.stream.read(remaining)
+            if not data:
+                break
+            parts.append(data)
+            remaining -= len(data)
+        return b"".join(parts)
+
+
+def iter_opus_packets(stream):
+    """Ogg Opus 스트림에서 오디오 패킷만 꺼냅니다. 헤더 패킷(OpusHead/OpusTags)은 오디오가 아니므로 건너뜁니다."""
+    for packet in discord.oggparse.OggStream(stream).iter_packets():
+        if not packet.startswith((b"OpusHead", b"OpusTags")):
+            yield packet
+
+
+class OggOpusAudio(discord.AudioSource):
+    """
+    Ogg Opus 스트림에서 Opus 패킷을 바로 꺼내는 오디오 소스.
+    OpenAI가 opus로 응답하면 FFmpeg 프로세스 없이 이 소스로 재생합니다. read는 오디오 스레드에서 호출됩니다.
+    """
+
+    def __init__(self, stream):
+        self._packets = iter_opus_packets(ExactReader(stream))
+
+    def read(self) -> bytes:
+        try:
+            return next(self._packets, b"")
+        except discord.oggparse.OggError as e:
+            log.error("Ogg Opus 스트림 파싱 오류: %s", e)
+            return b""
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class FFmpegProcessPool:
+    """
+    stdin을 기다리는 FFmpeg 프로세스를 미리 띄워 두는 풀.
+    FFmpeg는 입력 하나를 끝까지 변환하면 종료되므로 프로세스는 한 번만 쓰이고,
+    빌려 간 만큼 백그라운드 스레드에서 다시 채워 재생 경로에서는 프로세스를 만들지 않습니다.
+    stdin을 기다리는 FFmpeg는 자원을 거의 쓰지 않으므로 오래 놀았다고 버리지 않습니다.
+    """
+
+    def __init__(self, executable: str, size: int):
+        self.executable = executable
+        self.size = size
+        self._idle = deque()  # Popen
+        self._lock = threading.Lock()
+        self._refilling = False  # 채우는 스레드는 한 번에 하나만
+        self._closed = False
+
+    def _spawn(self) -> subprocess.Popen:
+        # discord.FFmpegOpusAudio와 같은 인코딩 옵션
+        args = [
+            self.executable, "-i", "pipe:0", "-map_metadata", "-1", "-f", "opus", "-c:a", "libopus",
+            "-ar", "48000", "-ac", "2", "-b:a", "128k", "-loglevel", "warning", "pipe:1",
+        ]
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+        return subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, creationflags=creationflags)
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if self._closed or len(self._idle) >= self.size:
+                        return
                 try:
-                    os.remove(filename)
-                    print(f"임시 파일 '{filename}' 삭제 완료.")
-                except Exception as e_del:
-                    print(f"임시 파일 '{filename}' 삭제 중 오류: {e_del}")
-
-        vc.play(source, after=after_playing)
-        play_success = True
-
-    except Exception as e:
-        error_message = f"오디오 재생 중 오류: {e}"
-        print(error_message)
-        if hasattr(ctx_for_feedback, 'send'): await ctx_for_feedback.send("오디오를 재생하는 중에 오류가 발생했습니다.")
-        play_success = False
-        # 오류 발생 시에도 파일이 생성되었을 수 있으므로 삭제 시도
-        if filename and os.path.exists(filename):
+                    process = self._spawn()
+                except OSError as e:
+                    log.error("FFmpeg 프로세스를 미리 띄우는 중 오류: %s", e)
+                    return
+                metrics.incr("ffmpeg_pool_spawns")
+                with self._lock:
+                    if self._closed:
+                        self._kill(process)
+                        return
+                    self._idle.append(process)
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def warm(self):
+        """부족한 만큼 백그라운드 스레드에서 프로세스를 띄웁니다."""
+        with self._lock:
+            if self._closed or self._refilling or len(self._idle) >= self.size:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, daemon=True, name="ffmpeg-pool-refill").start()
+
+    @staticmethod
+    def _is_healthy(process: subprocess.Popen) -> bool:
+        return process.poll() is None and not process.stdin.closed
+
+    async def acquire(self) -> subprocess.Popen:
+        """
+        준비된 프로세스를 하나 빌려줍니다. 풀이 비어 있으면 어쩔 수 없이 새로 띄웁니다.
+        프로세스 정리(kill/wait)와 새로 띄우기는 블로킹이므로 executor에서 실행해 이벤트 루프를 막지 않습니다.
+        """
+        loop = asyncio.get_running_loop()
+        process = None
+        dead = []
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if self._is_healthy(candidate):
+                    process = candidate
+                    break
+                dead.append(candidate)  # 죽은 프로세스는 버림
+        if dead:
+            # 정리는 재생을 늦추지 않도록 기다리지 않음
+            loop.run_in_executor(None, self._kill_all, dead)
+        self.warm()
+        if process is None:
+            metrics.incr("ffmpeg_cold_spawns")
+            process = await loop.run_in_executor(None, self._spawn)
+        return process
+
+    @staticmethod
+    def _kill(process: subprocess.Popen):
+        try:
+            process.kill()
+            process.wait(timeout=1)
+        except Exception:
+            pass
+
+    @classmethod
+    def _kill_all(cls, processes):
+        for process in processes:
+            cls._kill(process)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        self._kill_all(idle)
+
+
+ffmpeg_pool = FFmpegProcessPool(ffmpeg_executable_path, TTS_FFMPEG_POOL_SIZE)
+
+
+class PooledFFmpegOpusAudio(discord.AudioSource):
+    """풀에서 빌린 FFmpeg 프로세스로 opus가 아닌 오디오를 Opus로 변환해 재생하는 소스."""
+
+    def __init__(self, process: subprocess.Popen, stream):
+        self._process = process
+        self._packets = iter_opus_packets(process.stdout)
+        self._writer = threading.Thread(target=self._pipe_writer, args=(stream,), daemon=True,
+                                        name=f"ffmpeg-stdin-writer:pid-{process.pid}")
+        self._writer.start()
+
+    def _pipe_writer(self, stream):
+        try:
+            while True:
+                data = stream.read(8192)
+                if not data:
+                    break
+                self._process.stdin.write(data)
+        except (OSError, ValueError):
+            pass  # cleanup에서 프로세스를 먼저 정리한 경우
+        finally:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+
+    def read(self) -> bytes:
+        try:
+            return next(self._packets, b"")
+        except discord.oggparse.OggError as e:
+            log.error("FFmpeg 출력 파싱 오류: %s", e)
+            return b""
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        FFmpegProcessPool._kill(self._process)
+
+
+async def create_audio_source(audio) -> discord.AudioSource:
+    """임시 파일 없이 TTS 오디오(바이트 또는 AudioStreamBuffer)로 Opus 오디오 소스를 만듭니다."""
+    stream = io.BytesIO(audio) if isinstance(audio, bytes) else audio
+    if TTS_RESPONSE_FORMAT == "opus":
+        # 이미 Opus로 인코딩되어 있으므로 FFmpeg 없이 Ogg 컨테이너에서 패킷만 꺼냄
+        return OggOpusAudio(stream)
+    return PooledFFmpegOpusAudio(await ffmpeg_pool.acquire(), stream)
+
+
+class TTSSegment:
+    """TTSRequest를 문장 단위로 나눈 조각 하나. 합성 결과는 buffer로 스트리밍됩니다."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.buffer = None
+        self.synthesis = None  # synthesize_tts를 감싼 asyncio.Task
+
+    def start_synthesis(self, voice: str, guild_id: int = None):
+        if self.synthesis is None:
+            self.buffer = AudioStreamBuffer()
+            self.synthesis = asyncio.ensure_future(synthesize_tts(self.text, voice, guild_id, self.buffer))
+
+    def cancel(self):
+        if self.synthesis is not None and not self.synthesis.done():
+            self.synthesis.cancel()
+        if self.buffer is not None:
+            self.buffer.finish(failed=True)
+        self.synthesis = None
+        self.buffer = None
+
+
+class TTSRequest:
+    """재생 대기열에 들어가는 TTS 요청 하나. 문장 조각별 합성은 재생 차례가 오기 전에 미리 시작될 수 있습니다."""
+
+    def __init__(self, text: str, voice: str, ctx_for_feedback=None, guild_id: int = None,
+                 sheddable: bool = False, created_at: float = None):
+        self.text = text
+        self.voice = voice
+        self.ctx_for_feedback = ctx_for_feedback
+        self.guild_id = guild_id
+        self.sheddable = sheddable  # 대기열이 밀렸을 때 버려도 되는 요청인지 (리스닝 채널 메시지)
+        self.created_at = created_at if created_at is not None else time.monotonic()
+        self.segments = [TTSSegment(chunk) for chunk in split_tts_text(text)]
+
+    def cancel(self):
+        for segment in self.segments:
+            segment.cancel()
+
+    def merge(self, other: "TTSRequest"):
+        """overflow 정책이 coalesce일 때 뒤에 온 요청의 텍스트를 이어 붙입니다."""
+        self.cancel()  # 이미 시작된 합성은 합쳐진 텍스트로 다시 해야 함
+        self.text = f"{self.text} {other.text}"
+        self.sheddable = self.sheddable and other.sheddable
+        self.segments = [TTSSegment(chunk) for chunk in split_tts_text(self.text)]
+
+
+class PlaybackQueue:
+    """
+    음성 클라이언트(길드)별 TTS 재생 대기열.
+    재생이 끝나면 after 콜백으로 다음 조각을 재생하고, 재생 중에는 다음 prefetch개 조각을 미리 합성해 둡니다.
+    """
+
+    OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+
+    LAG_POLICIES = ("drop", "summarize")
+
+    def __init__(self, vc: discord.VoiceClient, max_depth: int, overflow: str, prefetch: int,
+                 max_lag: float = 0, lag_policy: str = "drop", coalesce_max_chars: int = TTS_COALESCE_MAX_CHARS):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"알 수 없는 overflow 정책입니다: {overflow}")
+        if lag_policy not in self.LAG_POLICIES:
+            raise ValueError(f"알 수 없는 lag 정책입니다: {lag_policy}")
+        self.vc = vc
+        self.max_depth = max_depth
+        self.overflow = overflow
+        self.prefetch = prefetch
+        self.max_lag = max_lag  # 0이면 밀린 메시지를 정리하지 않음
+        self.lag_policy = lag_policy
+        self.coalesce_max_chars = coalesce_max_chars
+        self.pending = deque()
+        self.dropped = 0
+        self.shed = 0  # 실시간보다 너무 밀려서 정리된 메시지 수
+        self._current = None  # 재생 중인 TTSRequest
+        self._current_index = 0  # 재생 중인 조각의 위치
+        self._player = None  # 대기열을 비우는 asyncio.Task
+
+    def __len__(self):
+        return len(self.pending)
+
+    @property
+    def is_active(self) -> bool:
+        return self._player is not None and not self._player.done()
+
+    def enqueue(self, request: TTSRequest) -> bool:
+        """요청을 대기열에 넣습니다. overflow 정책에 따라 버려지면 False를 돌려줍니다."""
+        if not request.segments:
+            return True  # 읽을 내용이 없음
+        if len(self.pending) >= self.max_depth:
+            if self.overflow == "drop_newest" or self.max_depth <= 0:
+                self.dropped += 1
+                metrics.incr("queue_dropped")
+                return False
+            if self.overflow == "coalesce" and self._can_merge(request):
+                self.pending[-1].merge(request)
+                metrics.incr("queue_coalesced")
+                self._prefetch()
+                return True
+            oldest = self.pending.popleft()
+            oldest.cancel()
+            self.dropped += 1
+            metrics.incr("queue_dropped")
+        self.pending.append(request)
+        self._prefetch()
+        if not self.is_active:
+            self._player = asyncio.ensure_future(self._run())
+        return True
+
+    def _can_merge(self, request: TTSRequest) -> bool:
+        """
+        마지막 대기 요청에 이어 붙일 수 있는지 확인합니다.
+        합칠 때마다 전체를 다시 나누고 합성하므로, coalesce_max_chars를 넘기면 합치지 않습니다.
+        """
+        if not self.pending:
+            return False
+        last = self.pending[-1]
+        return last.voice == request.voice and len(last.text) + 1 + len(request.text) <= self.coalesce_max_chars
+
+    def clear(self):
+        while self.pending:
+            self.pending.popleft().cancel()
+
+    def stop(self):
+        """대기열을 비우고 재생 중인 오디오도 멈춥니다."""
+        self.clear()
+        if self._current is not None:
+            self._current.cancel()
+        if self._player is not None:
+            self._player.cancel()
+            self._player = None
+        if self.vc.is_playing():
+            self.vc.stop()
+
+    def _shed_stale(self):
+        """max_lag보다 오래 기다린 리스닝 채널 메시지를 버리고, 정책에 따라 건너뛴 개수를 대신 읽어줍니다."""
+        if self.max_lag <= 0:
+            return
+        cutoff = time.monotonic() - self.max_lag
+        stale = [request for request in self.pending if request.sheddable and request.created_at < cutoff]
+        if not stale:
+            return
+        for request in stale:
+            self.pending.remove(request)
+            request.cancel()
+        self.shed += len(stale)
+        metrics.incr("queue_shed", len(stale))
+        log.info("재생 대기열이 %.0f초 이상 밀려 메시지 %d개를 건너뜁니다.", self.max_lag, len(stale))
+        if self.lag_policy == "summarize":
+            newest = stale[-1]
+            self.pending.appendleft(TTSRequest(f"밀린 메시지 {len(stale)}개를 건너뜁니다.", newest.voice, None, newest.guild_id))
+
+    def _upcoming(self):
+        """재생 순서대로 (요청, 조각)을 돌려줍니다. 재생 중인 요청의 남은 조각이 먼저 옵니다."""
+        if self._current is not None:
+            for segment in self._current.segments[self._current_index + 1:]:
+                yield self._current, segment
+        for request in self.pending:
+            for segment in request.segments:
+                yield request, segment
+
+    def _prefetch(self):
+        # 재생 중인 조각 다음의 prefetch개 조각만 미리 합성 (API 호출을 너무 앞당기지 않도록)
+        for request, segment in itertools.islice(self._upcoming(), self.prefetch):
+            segment.start_synthesis(request.voice, request.guild_id)
+
+    async def _run(self):
+        while self.pending:
+            self._shed_stale()
+            if not self.pending:
+                break  # 남아 있던 요청이 모두 밀린 메시지라 정리됨
+            request = self._current = self.pending.popleft()
             try:
-                os.remove(filename)
-            except Exception as e_del:
-                print(f"오류 후 임시 파일 '{filename}' 삭제 중 오류: {e_del}")
-    # finally 블록에서 파일 삭제 로직은 after 콜백으로 이전했으므로 제거 또는 수정
-    return play_success
+                for index, segment in enumerate(request.segments):
+                    self._current_index = index
+                    segment.start_synthesis(request.voice, request.guild_id)
+                    self._prefetch()
+                    # 조각 전체가 아니라 첫 데이터만 도착하면 바로 재생 시작
+                    if not await segment.buffer.wait_ready():
+                        await send_feedback(request.ctx_for_feedback, "TTS 오디오를 생성하는 데 실패했습니다.")
+                        break
+                    if not self.vc.is_connected():
+                        log.info("음성 채널 연결이 끊어져 대기열을 비웁니다.")
+                        self.clear()
+                        return
+                    # 첫 조각이면 메시지 수신부터 첫 소리까지의 시간을 기록
+                    await self._play(segment.buffer, request.ctx_for_feedback,
+                                     request.created_at if index == 0 else None)
+            finally:
+                request.cancel()  # 실패로 건너뛴 조각의 합성 정리
+                self._current = None
+
+    async def _play(self, audio, ctx_for_feedback=None, created_at: float = None):
+        """오디오를 재생하고 재생이 끝날 때까지 기다립니다."""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+        source = None
+        try:
+            with metrics.timer("pipe_setup"):
+                source = await create_audio_source(audio)
+            play_started = time.monotonic()
+
+            # 오디오 스레드에서 호출됨
+            def on_first_packet():
+                now = time.monotonic()
+                metrics.observe("ffmpeg_first_packet", now - play_started)
+                if created_at is not None:
+                    metrics.observe("time_to_first_audio", now - created_at)
+
+            # 다음 조각 재생을 위한 콜백 함수 (오디오 스레드에서 호출됨)
+            def after_playing(error):
+                metrics.observe("playback", time.monotonic() - play_started)
+                if error:
+                    metrics.incr("playback_errors")
+                    log.error("재생 오류: %s", error)
+                else:
+                    log_sampled(logging.DEBUG, "재생 완료.")
+                loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+
+            self.vc.play(InstrumentedAudioSource(source, on_first_packet), after=after_playing)
+        except Exception as e:
+            metrics.incr("playback_errors")
+            log.error("오디오 재생 중 오류: %s", e)
+            await send_feedback(ctx_for_feedback, "오디오를 재생하는 중에 오류가 발생했습니다.")
+            if source is not None:
+                source.cleanup()  # 재생을 시작하지 못했으면 FFmpeg 프로세스를 직접 정리
+            return
+        await finished
+
+
+class MessageCoalescer:
+    """
+    리스닝 채널 하나에서 window초 안에 연달아 온 메시지를 한 번의 TTS 요청으로 합칩니다.
+    재생 중이거나 대기 중인 것이 없으면 기다리지 않고 바로 읽고, 무언가 읽고 있을 때만 묶습니다.
+    author_prefix가 always면 모든 메시지 앞에, on_change면 말하는 사람이 바뀔 때만 "이름: "을 붙입니다.
+    """
+
+    AUTHOR_PREFIX_MODES = ("none", "always", "on_change")
+
+    def __init__(self, state: "GuildState", channel, window: float, author_prefix: str):
+        if author_prefix not in self.AUTHOR_PREFIX_MODES:
+            raise ValueError(f"알 수 없는 author_prefix 옵션입니다: {author_prefix}")
+        self.state = state
+        self.channel = channel
+        self.window = window
+        self.author_prefix = author_prefix
+        self.pending = []  # (작성자 이름, 내용)
+        self.first_at = None  # 묶음의 첫 메시지가 도착한 시각
+        self._last_author = None
+        self._timer = None
+        self._in_flight = None  # 대기열에 넣는 중인 play_tts_in_vc 태스크
+
+    def _is_idle(self) -> bool:
+        if self._in_flight is not None and not self._in_flight.done():
+            return False
+        queue = self.state.playback_queue
+        return queue is None or (not queue.is_active and not queue.pending)
 
+    def add(self, author_name: str, content: str):
+        if not self.pending:
+            self.first_at = time.monotonic()
+        self.pending.append((author_name, content))
+        if self._timer is None:
+            if self._is_idle():
+                self._flush()  # 혼자 온 메시지는 기다릴 이유가 없음
+                return
+            # 묶음의 첫 메시지부터 window초 뒤에 읽음 (메시지가 계속 와도 무한정 미뤄지지 않도록)
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _compose(self) -> str:
+        lines = []
+        for author_name, content in self.pending:
+            if self.author_prefix == "always" or (self.author_prefix == "on_change" and author_name != self._last_author):
+                lines.append(f"{author_name}: {content}")
+            else:
+                lines.append(content)
+            self._last_author = author_name
+        return "\n".join(lines)
+
+    def _flush(self):
+        self._timer = None
+        if not self.pending:
+            return
+        text = self._compose()
+        created_at = self.first_at
+        count = len(self.pending)
+        self.pending = []
+        if not self.state.is_connected:
+            log.info("음성 채널에 연결되어 있지 않아 묶인 메시지 %d개를 스킵합니다.", count)
+            return
+        if count > 1:
+            metrics.incr("messages_coalesced", count - 1)
+            log_sampled(logging.DEBUG, "채널(%s) 메시지 %d개를 한 번에 읽습니다.", self.channel.name, count)
+        self._in_flight = asyncio.ensure_future(play_tts_in_vc(self.state.voice_client, text, self.channel,
+                                                               sheddable=True, created_at=created_at))
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.pending = []
+
+
+class GuildState:
+    """길드 하나의 음성 클라이언트, 리스닝 채널, 목소리, 재생 대기열."""
+
+    def __init__(self, guild_id: int, listen_channel_ids=None, tts_voice: str = DEFAULT_TTS_VOICE):
+        self.guild_id = guild_id
+        self.listen_channel_ids = set(listen_channel_ids or ())
+        self.tts_voice = tts_voice
+        self.voice_client = None  # 현재 연결된 음성 클라이언트 (저장하지 않음)
+        self.playback_queue = None
+        self.tts_semaphore = asyncio.Semaphore(TTS_GUILD_CONCURRENCY) # 길드별 동시 합성 제한
+        self.coalescers = {}  # 리스닝 채널 ID -> MessageCoalescer
+
+    @property
+    def is_connected(self) -> bool:
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+    def get_playback_queue(self, vc: discord.VoiceClient) -> PlaybackQueue:
+        if self.playback_queue is None:
+            self.playback_queue = PlaybackQueue(vc, TTS_QUEUE_MAX_DEPTH, TTS_QUEUE_OVERFLOW, TTS_PREFETCH,
+                                                LISTEN_MAX_LAG, LISTEN_LAG_POLICY)
+        else:
+            self.playback_queue.vc = vc  # 재연결로 음성 클라이언트가 바뀌었을 수 있음
+        return self.playback_queue
+
+    def get_coalescer(self, channel) -> MessageCoalescer:
+        coalescer = self.coalescers.get(channel.id)
+        if coalescer is None:
+            coalescer = MessageCoalescer(self, channel, LISTEN_COALESCE_WINDOW, LISTEN_AUTHOR_PREFIX)
+            self.coalescers[channel.id] = coalescer
+        return coalescer
+
+    def reset_voice(self):
+        """음성 연결이 끊어졌을 때 대기열과 음성 클라이언트를 정리합니다."""
+        for coalescer in self.coalescers.values():
+            coalescer.cancel()
+        if self.playback_queue is not None:
+            self.playback_queue.stop()
+            self.playback_queue = None
+        self.voice_client = None
+
+    def to_dict(self) -> dict:
+        return {"listen_channel_ids": sorted(self.listen_channel_ids), "tts_voice": self.tts_voice}
+
+    @classmethod
+    def from_dict(cls, guild_id: int, data: dict) -> "GuildState":
+        voice = data.get("tts_voice", DEFAULT_TTS_VOICE)
+        if voice not in AVAILABLE_VOICES:
+            voice = DEFAULT_TTS_VOICE
+        return cls(guild_id, data.get("listen_channel_ids"), voice)
+
+
+class GuildStateRegistry:
+    """
+    길드 ID별 GuildState 저장소.
+    샤드가 여러 개여도 한 프로세스의 이벤트 루프에서 돌아가므로 dict 하나로 충분하며,
+    리스닝 채널과 목소리 설정은 JSON 파일에 저장되어 재시작 후에도 유지됩니다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._states = {}
+        self._save_lock = asyncio.Lock()  # 저장이 동시에 실행되면 임시 파일이 뒤섞이므로 하나씩
+
+    def get(self, guild_id: int) -> GuildState:
+        state = self._states.get(guild_id)
+        if state is None:
+            state = GuildState(guild_id)
+            self._states[guild_id] = state
+        return state
+
+    def __iter__(self):
+        return iter(self._states.values())
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("봇 상태 파일 '%s'을(를) 읽는 중 오류: %s", self.path, e)
+            return
+        for guild_id, guild_data in data.get("guilds", {}).items():
+            self._states[int(guild_id)] = GuildState.from_dict(int(guild_id), guild_data)
+        log.info("봇 상태 파일에서 %d개 길드의 설정을 불러왔습니다.", len(self._states))
+
+    def _save_sync(self, data: dict):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".bot_state.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)  # 저장 도중 종료되어도 파일이 깨지지 않도록 원자적으로 교체
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    async def save(self):
+        try:
+            async with self._save_lock:
+                # 잠금을 잡은 뒤에 상태를 읽어야 늦게 끝난 저장이 최신 상태를 덮어쓰지 않음
+                data = {"guilds": {str(state.guild_id): state.to_dict() for state in self._states.values()}}
+                await asyncio.get_running_loop().run_in_executor(None, self._save_sync, data)
+        except OSError as e:
+            log.warning("봇 상태 파일 '%s' 저장 중 오류: %s", self.path, e)
+
+
+guild_states = GuildStateRegistry(BOT_STATE_PATH)
+guild_states.load()
+
+
+async def play_tts_in_vc(vc: discord.VoiceClient, text_to_say: str, ctx_for_feedback=None,
+                         sheddable: bool = False, created_at: float = None):
+    """지정된 음성 클라이언트의 재생 대기열에 TTS를 추가합니다."""
+    if not vc or not vc.is_connected():
+        await send_feedback(ctx_for_feedback, "봇이 음성 채널에 연결되어 있지 않습니다.")
+        return False
+
+    state = guild_states.get(vc.guild.id)
+    queue = state.get_playback_queue(vc)
+    waiting = len(queue) + (1 if queue.is_active else 0)
+    request = TTSRequest(text_to_say, state.tts_voice, ctx_for_feedback, vc.guild.id, sheddable, created_at)
+    if not queue.enqueue(request):
+        await send_feedback(ctx_for_feedback, "대기열이 가득 차서 이 메시지는 읽지 않아요.")
+        return False
+
+    if hasattr(ctx_for_feedback, 'send'):
+        if waiting:
+            await ctx_for_feedback.send(f'대기열에 추가했어요 (앞에 {waiting}개): "{text_to_say}"')
+        else:
+            await ctx_for_feedback.send(f'잠시만 기다려주세요: "{text_to_say}"')
+    return True
+
+
+metrics_dump_task = None
 
 @bot.event
 async def on_ready():
-    # global current_vc # on_ready에서는 current_vc를 직접 수정하지 않으므로 global 선언 불필요
-    print(f"{bot.user} 연결 완료!")
+    print(f"{bot.user} 연결 완료! (길드 {len(bot.guilds)}개, 샤드 {bot.shard_count or 1}개)")
     # .env 파일에서 TARGET_TEXT_CHANNEL_ID, TARGET_VOICE_CHANNEL_ID 읽는 부분은
     # 사용자의 새 요구사항에 따라 제거되었으므로 관련 로직도 제거합니다.
     print("봇이 메시지를 읽을 텍스트 채널을 설정하려면 `!set_listen_channel #채널명` 또는 `!set_listen_channel 채널이름` 명령어를 사용하세요.")
     print("봇을 음성 채널에 참여시키려면 `!join` 또는 `!join 채널이름` 명령어를 사용하세요.")
-    print(f"현재 TTS 목소리: {current_tts_voice}. 변경하려면 `!목소리 목소리이름`을 사용하세요.")
+    print(f"기본 TTS 목소리: {DEFAULT_TTS_VOICE}. 길드별로 변경하려면 `!목소리 목소리이름`을 사용하세요.")
     print("사용 가능한 목소리 목록은 `!voices` 명령어로 확인할 수 있습니다.")
+    if TTS_RESPONSE_FORMAT != "opus":
+        ffmpeg_pool.warm() # 첫 메시지부터 프로세스 생성 없이 재생하도록 미리 띄워 둠
+    global metrics_dump_task
+    if METRICS_DUMP_PATH and metrics_dump_task is None: # on_ready는 재연결 때마다 다시 호출됨
+        metrics_dump_task = asyncio.ensure_future(dump_metrics_periodically())
 
 
 @bot.event
 async def on_message(message: discord.Message):
-    global current_vc, listening_text_channel_id # 전역 변수 사용 명시
-
     if message.author == bot.user or message.author.bot:
         return
 
@@ -143,60 +1287,90 @@ async def on_message(message: discord.Message):
         await bot.process_commands(message)
         return # 명령어가 처리되었으면 이후 로직 실행 안 함
 
+    if message.guild is None: # DM은 읽지 않음
+        return
+    state = guild_states.get(message.guild.id)
+
     # 설정된 리스닝 채널의 메시지인지 확인
-    if listening_text_channel_id and message.channel.id == listening_text_channel_id:
+    if message.channel.id in state.listen_channel_ids:
         if not message.author.voice or not message.author.voice.channel:
-            print(f"메시지 작성자 '{message.author.name}'가 음성 채널에 없습니다. TTS를 스킵합니다.")
+            log_sampled(logging.DEBUG, "메시지 작성자 '%s'가 음성 채널에 없습니다. TTS를 스킵합니다.", message.author.name)
             # 필요시 사용자에게 알림: await message.channel.send("음성 채널에 먼저 참여해주세요.")
             return
 
         user_voice_channel = message.author.voice.channel
 
         # 봇 음성 채널 연결 또는 이동 로직
-        if not current_vc or not current_vc.is_connected():
+        if not state.is_connected:
             try:
-                current_vc = await user_voice_channel.connect()
-                print(f"사용자 '{message.author.name}'의 음성 채널 '{user_voice_channel.name}'에 연결했습니다.")
+                with metrics.timer("voice_connect"):
+                    state.voice_client = await user_voice_channel.connect()
+                log.info("사용자 '%s'의 음성 채널 '%s'에 연결했습니다.", message.author.name, user_voice_channel.name)
             except Exception as e:
-                print(f"음성 채널 '{user_voice_channel.name}' 연결 중 오류: {e}")
+                log.error("음성 채널 '%s' 연결 중 오류: %s", user_voice_channel.name, e)
                 await message.channel.send(f"음성 채널 '{user_voice_channel.name}'에 연결 중 오류가 발생했습니다: {e}")
                 return
-        elif current_vc.channel != user_voice_channel:
+        elif state.voice_client.channel != user_voice_channel:
             try:
-                await current_vc.move_to(user_voice_channel)
-                print(f"사용자 '{message.author.name}'의 음성 채널 '{user_voice_channel.name}'으로 이동했습니다.")
+                with metrics.timer("voice_connect"):
+                    await state.voice_client.move_to(user_voice_channel)
+                log.info("사용자 '%s'의 음성 채널 '%s'으로 이동했습니다.", message.author.name, user_voice_channel.name)
             except Exception as e:
-                print(f"음성 채널 '{user_voice_channel.name}'으로 이동 중 오류: {e}")
+                log.error("음성 채널 '%s'으로 이동 중 오류: %s", user_voice_channel.name, e)
                 await message.channel.send(f"음성 채널 '{user_voice_channel.name}'으로 이동 중 오류가 발생했습니다: {e}")
                 return
         
-        if current_vc and current_vc.is_connected():
-            print(f"채널({message.channel.name}) 메시지 수신: '{message.content}' -> TTS 시도")
-            # play_tts_in_vc 호출 시 ctx_for_feedback으로 message.channel 전달
-            await play_tts_in_vc(current_vc, message.content, message.channel) 
+        if state.is_connected:
+            metrics.incr("messages_received")
+            log_sampled(logging.DEBUG, "채널(%s) 메시지 수신: '%s' -> TTS 시도", message.channel.name, message.content)
+            # 연달아 오는 메시지는 묶어서 한 번에 읽음 (피드백은 message.channel로 전달)
+            state.get_coalescer(message.channel).add(message.author.display_name, message.content)
         else:
-            print("알 수 없는 이유로 음성 채널에 연결되지 않았습니다. TTS를 스킵합니다.")
+            log.warning("알 수 없는 이유로 음성 채널에 연결되지 않았습니다. TTS를 스킵합니다.")
             await message.channel.send("봇이 음성 채널에 정상적으로 연결되지 않아 TTS를 재생할 수 없습니다.")
 
 
-@bot.command(name='채널', help="봇이 메시지를 읽을 텍스트 채널을 설정합니다. 예: !set_listen_channel #일반 또는 !set_listen_channel 일반")
+@bot.event
+async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+    # 봇이 강제로 음성 채널에서 나가게 된 경우 해당 길드의 대기열 정리
+    if member.id == bot.user.id and before.channel and not after.channel:
+        guild_states.get(member.guild.id).reset_voice()
+
+
+@bot.command(name='채널', help="봇이 메시지를 읽을 텍스트 채널을 추가합니다. 예: !채널 #일반 또는 !채널 일반")
+@commands.guild_only()
 async def set_listen_channel_command(ctx, channel_input: discord.TextChannel = None): # 타입 힌트 사용
-    global listening_text_channel_id
-    
     if channel_input:
-        listening_text_channel_id = channel_input.id
+        guild_states.get(ctx.guild.id).listen_channel_ids.add(channel_input.id)
+        await guild_states.save()
         await ctx.send(f"이제부터 '{channel_input.name}' 채널의 메시지를 읽습니다.")
-        print(f"리스닝 채널이 '{channel_input.name}' (ID: {channel_input.id})로 설정되었습니다.")
+        print(f"[{ctx.guild.name}] 리스닝 채널 '{channel_input.name}' (ID: {channel_input.id})이(가) 추가되었습니다.")
+    else:
+        await ctx.send("올바른 텍스트 채널을 멘션하거나 채널 이름을 정확히 입력해주세요. 예: `!채널 #채널명`")
+
+@bot.command(name='채널해제', help="봇이 더 이상 메시지를 읽지 않을 텍스트 채널을 지정합니다. 예: !채널해제 #일반")
+@commands.guild_only()
+async def remove_listen_channel_command(ctx, channel_input: discord.TextChannel = None):
+    state = guild_states.get(ctx.guild.id)
+    if channel_input and channel_input.id in state.listen_channel_ids:
+        state.listen_channel_ids.discard(channel_input.id)
+        coalescer = state.coalescers.pop(channel_input.id, None)
+        if coalescer:
+            coalescer.cancel()
+        await guild_states.save()
+        await ctx.send(f"이제 '{channel_input.name}' 채널의 메시지를 읽지 않습니다.")
     else:
-        await ctx.send("올바른 텍스트 채널을 멘션하거나 채널 이름을 정확히 입력해주세요. 예: `!set_listen_channel #채널명`")
+        await ctx.send("메시지를 읽고 있는 텍스트 채널을 멘션해주세요. 예: `!채널해제 #채널명`")
 
 @bot.command(name='목소리', help=f"TTS 목소리를 변경합니다. 사용 가능한 목소리: {', '.join(AVAILABLE_VOICES)}")
+@commands.guild_only()
 async def 목소리리_command(ctx, voice_name: str):
-    global current_tts_voice
     if voice_name.lower() in AVAILABLE_VOICES:
-        current_tts_voice = voice_name.lower()
-        await ctx.send(f"TTS 목소리가 '{current_tts_voice}'(으)로 변경되었습니다.")
-        print(f"TTS 목소리가 '{current_tts_voice}'(으)로 변경되었습니다.")
+        state = guild_states.get(ctx.guild.id)
+        state.tts_voice = voice_name.lower()
+        await guild_states.save()
+        await ctx.send(f"TTS 목소리가 '{state.tts_voice}'(으)로 변경되었습니다.")
+        print(f"[{ctx.guild.name}] TTS 목소리가 '{state.tts_voice}'(으)로 변경되었습니다.")
     else:
         await ctx.send(f"잘못된 목소리 이름입니다. 사용 가능한 목소리: {', '.join(AVAILABLE_VOICES)}\n`!voices` 명령어로 자세한 정보를 확인하세요.")
 
@@ -216,9 +1390,9 @@ async def voices_command(ctx):
     await ctx.send(voice_list_message)
 
 @bot.command(name='join', help="봇을 현재 사용자의 음성 채널 또는 지정된 음성 채널에 참여시킵니다.")
+@commands.guild_only()
 async def join_voice_channel(ctx, *, channel_name: str = None):
-    global current_vc
-    
+    state = guild_states.get(ctx.guild.id)
     target_voice_channel = None
     if channel_name:
         target_voice_channel = discord.utils.get(ctx.guild.voice_channels, name=channel_name)
@@ -231,45 +1405,90 @@ async def join_voice_channel(ctx, *, channel_name: str = None):
         await ctx.send("음성 채널에 먼저 참여하시거나, 참여할 음성 채널 이름을 지정해주세요.")
         return
 
-    if current_vc and current_vc.is_connected():
-        if current_vc.channel == target_voice_channel:
+    if state.is_connected:
+        if state.voice_client.channel == target_voice_channel:
             await ctx.send(f"이미 '{target_voice_channel.name}' 채널에 있습니다.")
         else:
             try:
-                await current_vc.move_to(target_voice_channel)
+                with metrics.timer("voice_connect"):
+                    await state.voice_client.move_to(target_voice_channel)
                 await ctx.send(f"'{target_voice_channel.name}' 채널로 이동했습니다.")
             except Exception as e:
                 await ctx.send(f"'{target_voice_channel.name}' 채널로 이동 중 오류: {e}")
     else:
         try:
-            current_vc = await target_voice_channel.connect()
+            with metrics.timer("voice_connect"):
+                state.voice_client = await target_voice_channel.connect()
             await ctx.send(f"'{target_voice_channel.name}' 채널에 연결했습니다.")
         except Exception as e:
             await ctx.send(f"'{target_voice_channel.name}' 채널 연결 중 오류: {e}")
 
 @bot.command(name='leave', help="봇을 현재 음성 채널에서 내보냅니다.")
+@commands.guild_only()
 async def leave_voice_channel(ctx):
-    global current_vc
-    if current_vc and current_vc.is_connected():
-        await current_vc.disconnect()
-        current_vc = None 
+    state = guild_states.get(ctx.guild.id)
+    if state.is_connected:
+        voice_client = state.voice_client
+        state.reset_voice()
+        await voice_client.disconnect()
         await ctx.send("음성 채널 연결을 종료했습니다.")
     else:
         await ctx.send("연결된 음성 채널이 없습니다.")
 
+@bot.command(name='캐시', help="TTS 오디오 캐시의 적중/실패 통계를 보여줍니다.")
+async def cache_stats_command(ctx):
+    stats = tts_cache.stats()
+    await ctx.send(
+        "TTS 캐시 통계\n"
+        f"- 메모리 적중: {stats['memory_hits']}\n"
+        f"- 디스크 적중: {stats['disk_hits']}\n"
+        f"- 실패: {stats['misses']}\n"
+        f"- 적중률: {stats['hit_rate']:.1%}\n"
+        f"- 제거된 항목: {stats['evictions']}\n"
+        f"- 메모리 사용량: {stats['memory_bytes'] / 1024:.0f}KB ({stats['memory_entries']}개)\n"
+        f"- 디스크 사용량: {stats['disk_bytes'] / 1024:.0f}KB"
+    )
+
+@bot.command(name='stats', help="TTS 파이프라인 단계별 지연 시간 통계를 보여줍니다. `!stats prometheus`는 Prometheus 형식 파일을 보냅니다.")
+async def stats_command(ctx, output_format: str = "text"):
+    if output_format.lower() in ("prometheus", "prom"):
+        dump = io.BytesIO(metrics.render_prometheus().encode("utf-8"))
+        await ctx.send(file=discord.File(dump, filename="dico_bot_metrics.prom"))
+    else:
+        await ctx.send(metrics.render_text())
+
+async def dump_metrics_periodically():
+    """METRICS_DUMP_PATH에 Prometheus 텍스트 형식으로 주기적으로 저장합니다. (node_exporter textfile collector용)"""
+    loop = asyncio.get_running_loop()
+
+    def write_dump(text: str):
+        tmp_path = f"{METRICS_DUMP_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, METRICS_DUMP_PATH)
+
+    while True:
+        try:
+            await loop.run_in_executor(None, write_dump, metrics.render_prometheus())
+        except OSError as e:
+            log.warning("지표 파일 '%s' 저장 중 오류: %s", METRICS_DUMP_PATH, e)
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+
 @bot.command()
 async def ping(ctx):
     await ctx.send("Pong!")
 
 @bot.command()
+@commands.guild_only()
 async def say(ctx, *, text: str):
-    global current_vc
-    if not current_vc or not current_vc.is_connected():
+    state = guild_states.get(ctx.guild.id)
+    if not state.is_connected:
         if ctx.author.voice and ctx.author.voice.channel:
             user_vc = ctx.author.voice.channel
-            print(f"!say 명령어: 사용자의 음성 채널 '{user_vc.name}'에 연결 시도")
+            log.info("!say 명령어: 사용자의 음성 채널 '%s'에 연결 시도", user_vc.name)
             try:
-                current_vc = await user_vc.connect()
+                with metrics.timer("voice_connect"):
+                    state.voice_client = await user_vc.connect()
                 await ctx.send(f"'{user_vc.name}' 채널에 연결했습니다.")
             except Exception as e:
                 await ctx.send(f"음성 채널 '{user_vc.name}' 연결 중 오류: {e}")
@@ -278,9 +1497,9 @@ async def say(ctx, *, text: str):
             await ctx.send("봇이 음성 채널에 없거나, 당신도 음성 채널에 없습니다. `!join` 명령어로 봇을 참여시키거나 음성 채널에 먼저 입장해주세요.")
             return
     
-    if current_vc and current_vc.is_connected():
+    if state.is_connected:
         # say 명령어의 경우 ctx를 feedback context로 전달
-        await play_tts_in_vc(current_vc, text, ctx) 
+        await play_tts_in_vc(state.voice_client, text, ctx)
     else:
         await ctx.send("음성 채널에 연결되어 있지 않아 TTS를 재생할 수 없습니다.")
 
@@ -310,4 +1529,4 @@ if __name__ == "__main__":
          # FFmpeg를 찾지 못해도 일단 봇 실행은 계속하도록 exit()는 주석 처리 또는 제거
          # exit() 
 
-    bot.run(TOKEN)
\ No newline at end of file
+    bot.run(TOKEN, log_handler=None) # 로깅은 위의 logging.basicConfig 설정을 그대로 사용
\ No newline at end of file
@@ -1,7 +1,24 @@
+import abc
 import asyncio
+import bisect
+import contextlib
+import inspect
+import itertools
+import json
+import os
 import time
 import logging
-from typing import List, Dict, Any, Optional
+import random
+import re
+import sqlite3
+import threading
+import multiprocessing
+import queue
+import zlib
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, Iterable, AsyncIterable, AsyncIterator, Iterator, Sequence, Union, Callable
 from urllib.parse import urlparse
 
 # 비동기 HTTP 요청을 위한 aiohttp 라이브러리 필요
@@ -12,94 +29,1412 @@ except ImportError:
     print("aiohttp 라이브러리가 필요합니다. 'pip install aiohttp' 명령어로 설치해주세요.")
     exit()
 
+# 더 빠른 JSON 디코더가 있으면 사용 (pip install orjson)
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=str)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, default=str).encode()
+
 # 로깅 설정
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] (%(threadName)s) %(message)s',
 )
 
+# URL 목록, 제너레이터 같은 일반 이터러블, 또는 비동기 이터러블
+UrlSource = Union[Iterable[str], AsyncIterable[str]]
+
+# 큐에서 입력/작업이 끝났음을 알리는 표시
+_DONE = object()
+
+
+async def _iter_urls(urls: UrlSource) -> AsyncIterator[str]:
+    """일반 이터러블과 비동기 이터러블을 모두 비동기 이터레이터로 다룹니다."""
+    if hasattr(urls, '__aiter__'):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+
+# 서버가 과부하를 알리는 상태 코드. 이 응답을 받으면 해당 호스트의 동시 요청 한도를 줄입니다.
+OVERLOAD_STATUSES = {429, 503}
+
+
+def _host_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def _interleave_hosts(urls: Sequence[str]) -> Iterator[str]:
+    """
+    이미 메모리에 있는 URL 목록을 호스트끼리 번갈아 가며 돌려줍니다.
+    목록이 호스트별로 몰려 있어도 느린 호스트의 URL이 대기 큐를 모두 차지해 다른 호스트의 URL이 들어오지 못하는 일을 막습니다.
+    """
+    by_host: "OrderedDict[str, deque]" = OrderedDict()
+    for url in urls:
+        by_host.setdefault(_host_of(url), deque()).append(url)
+    while by_host:
+        for host in list(by_host):
+            pending = by_host[host]
+            yield pending.popleft()
+            if not pending:
+                del by_host[host]
+
+
+# 재시도할 만한 연결 수준 오류 (연결 실패, 서버가 연결을 끊음, 본문 수신 중단 등)
+RETRYABLE_CLIENT_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+
+class RetryableStatusError(Exception):
+    """재시도 대상 상태 코드(429, 5xx 등)를 받았을 때 내부에서 쓰는 예외."""
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 헤더(초 또는 HTTP 날짜)를 대기 시간(초)으로 바꿉니다."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """
+    재시도 정책. 대기 시간은 full jitter 지수 백오프(0 ~ base_delay * 2^retry, 최대 max_delay)이며,
+    서버가 Retry-After를 보내면 그 값을 우선합니다.
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    retry_statuses: frozenset = field(default_factory=lambda: frozenset({408, 425, 429, 500, 502, 503, 504}))
+    respect_retry_after: bool = True
+
+    def delay(self, retry: int, retry_after: Optional[float] = None) -> float:
+        if self.respect_retry_after and retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class TokenBucket:
+    """호스트별 요청 속도 제한. 초당 rate개씩 토큰이 채워지고 최대 burst개까지 쌓입니다."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class CachedResponse:
+    """캐시에 저장된 응답 하나."""
+    url: str
+    status: int
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """재검증 요청에 붙일 If-None-Match / If-Modified-Since 헤더."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+_MAX_AGE_RE = re.compile(r'max-age\s*=\s*"?(\d+)"?', re.IGNORECASE)
+
+
+class ResponseCache:
+    """
+    SQLite 파일에 응답 본문을 저장하는 조건부 요청 캐시.
+    만료 전이면 요청 없이 캐시를 쓰고, 만료됐으면 ETag/Last-Modified로 재검증해 304면 저장된 본문을 다시 씁니다.
+    유효 시간은 Cache-Control의 max-age를 우선하고, 없으면 default_ttl을 씁니다.
+    전체 본문 크기가 max_bytes를 넘으면 가장 오래 쓰지 않은 항목부터 지웁니다.
+    전체 크기는 SQLite 트리거가 같은 트랜잭션 안에서 갱신하므로 여러 프로세스가 같은 파일을 써도 한도가 지켜집니다.
+    메서드는 블로킹이므로 이벤트 루프에서는 run_in_executor로 호출합니다.
+    """
+
+    def __init__(self, path: str, default_ttl: float = 300.0, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()  # run_in_executor 스레드에서 호출되므로 필요
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY, status INTEGER, body BLOB, etag TEXT, last_modified TEXT,"
+            " expires_at REAL, last_access REAL, size INTEGER)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        with self._transaction():
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._db.execute(
+                "INSERT OR IGNORE INTO cache_stats SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM responses"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses BEGIN"
+                " UPDATE cache_stats SET value = value + NEW.size WHERE name = 'total_bytes'; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses BEGIN"
+                " UPDATE cache_stats SET value = value - OLD.size WHERE name = 'total_bytes'; END"
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # 쓰기 잠금을 바로 잡아 다른 프로세스의 저장/삭제와 섞이지 않게 함
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _total_bytes(self) -> int:
+        return self._db.execute("SELECT value FROM cache_stats WHERE name = 'total_bytes'").fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        """저장된 본문 크기의 합 (같은 파일을 쓰는 모든 프로세스 기준)."""
+        with self._lock:
+            return self._total_bytes()
+
+    def ttl_for(self, headers) -> Optional[float]:
+        """응답 헤더로 유효 시간(초)을 정합니다. 저장하면 안 되는 응답이면 None."""
+        cache_control = headers.get('Cache-Control', '')
+        lowered = cache_control.lower()
+        if 'no-store' in lowered:
+            return None
+        if 'no-cache' in lowered:
+            return 0.0  # 저장은 하되 쓸 때마다 재검증
+        match = _MAX_AGE_RE.search(cache_control)
+        if match:
+            return float(match.group(1))
+        return self.default_ttl
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, body, etag, last_modified, expires_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+        return CachedResponse(url, *row)
+
+    def put(self, url: str, status: int, body: bytes, headers, ttl: float):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._transaction():
+            # INSERT OR REPLACE는 삭제 트리거를 부르지 않으므로 직접 지우고 넣음
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._db.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, status, body, headers.get('ETag'), headers.get('Last-Modified'), now + ttl, now, size),
+            )
+            self._evict()
+
+    def refresh(self, url: str, headers, ttl: float):
+        """304를 받았을 때 유효 시간을 늘리고, 서버가 새 검증자를 보냈으면 갱신합니다."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET expires_at = ?, last_access = ?,"
+                " etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (now + ttl, now, headers.get('ETag'), headers.get('Last-Modified'), url),
+            )
+
+    def delete(self, url: str):
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+
+    def _evict(self):
+        """put()의 트랜잭션 안에서 호출됩니다."""
+        total = self._total_bytes()
+        while total > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT url, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                total -= size
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __reduce__(self):
+        # 샤드 프로세스로 넘길 때는 같은 파일을 다시 엽니다 (SQLite가 프로세스 간 잠금을 처리)
+        return (ResponseCache, (self.path, self.default_ttl, self.max_bytes))
+
+
+class AdaptiveHostLimit:
+    """
+    호스트 하나의 동시 요청 한도를 AIMD 방식으로 조절합니다.
+    성공한 응답이 한도만큼 쌓이면 한도를 1 늘리고, 429/503/타임아웃이 오면 절반으로 줄입니다.
+    latency_factor를 주면 첫 바이트까지의 시간(ttfb)이 그 호스트에서 본 가장 빠른 값의 latency_factor배를 넘을 때도 줄입니다.
+    원래 느린 호스트를 과부하로 보지 않도록 고정된 시간이 아니라 호스트별 기준값과 비교합니다.
+    """
+
+    # 한 번 줄인 뒤 다시 줄이기까지의 최소 간격 (초)
+    DECREASE_INTERVAL = 1.0
+    # 기준 ttfb의 하한. 로컬 서버처럼 아주 빠른 호스트에서 작은 흔들림을 과부하로 보지 않도록 (초)
+    MIN_BASELINE = 0.05
+
+    def __init__(self, initial: int, minimum: int, maximum: int, adaptive: bool = True,
+                 latency_factor: Optional[float] = None):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.adaptive = adaptive
+        self.latency_factor = latency_factor
+        self.baseline: Optional[float] = None  # 지금까지 본 가장 짧은 ttfb
+        self.in_flight = 0
+        self._last_decrease = 0.0
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.in_flight < max(self.minimum, int(self.limit))
+
+    def on_success(self, ttfb: float):
+        if not self.adaptive:
+            return
+        if self.latency_factor is not None:
+            if self.baseline is None or ttfb < self.baseline:
+                self.baseline = ttfb
+            if ttfb > max(self.baseline, self.MIN_BASELINE) * self.latency_factor:
+                self._decrease()
+                return
+        self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+
+    def on_overload(self):
+        if self.adaptive:
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        # 같은 혼잡 때문에 동시에 실패한 요청들이 한도를 여러 번 줄이지 않도록 잠시 간격을 둠
+        if now - self._last_decrease < self.DECREASE_INTERVAL:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit / 2)
+
+
+class HostAwareQueue:
+    """
+    호스트별로 URL을 나눠 담는 크기 제한 큐.
+    get()은 동시 요청 한도에 여유가 있는 호스트의 URL만 꺼내므로, 느린 호스트 하나가 worker를 모두 붙잡지 않습니다.
+    """
+
+    def __init__(self, maxsize: int, limit_for: Callable[[str], AdaptiveHostLimit]):
+        self.maxsize = maxsize
+        self.limit_for = limit_for
+        self._by_host: "OrderedDict[str, deque]" = OrderedDict()
+        self._size = 0
+        self._closed = False
+        self._cond = asyncio.Condition()
+
+    async def put(self, url: str):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._size < self.maxsize)
+            self._by_host.setdefault(_host_of(url), deque()).append((url, time.monotonic()))
+            self._size += 1
+            self._cond.notify_all()
+
+    async def close(self):
+        """더 이상 넣을 URL이 없음을 알립니다. 남은 URL이 모두 꺼내지면 get()은 _DONE을 돌려줍니다."""
+        async with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _pop_ready(self) -> Optional[tuple]:
+        for host in self._by_host:
+            limit = self.limit_for(host)
+            if limit.has_capacity:
+                urls = self._by_host[host]
+                item = urls.popleft()
+                if urls:
+                    self._by_host.move_to_end(host)  # 호스트끼리 돌아가며 꺼내도록
+                else:
+                    del self._by_host[host]
+                self._size -= 1
+                limit.in_flight += 1
+                return item
+        return None
+
+    async def get(self):
+        """
+        한도에 여유가 있는 호스트의 URL을 꺼내고 그 호스트의 슬롯을 잡습니다.
+        (URL, 큐에 들어온 시각)을 돌려주며, 다 끝나면 _DONE.
+        """
+        async with self._cond:
+            while True:
+                item = self._pop_ready()
+                if item is not None:
+                    self._cond.notify_all()
+                    return item
+                if self._closed and self._size == 0:
+                    return _DONE
+                await self._cond.wait()
+
+    async def release(self, url: str):
+        """get()으로 잡은 호스트 슬롯을 돌려줍니다."""
+        async with self._cond:
+            self.limit_for(_host_of(url)).in_flight -= 1
+            self._cond.notify_all()
+
+
+class Histogram:
+    """값을 고정된 버킷 경계로 세는 히스토그램. 시간(초)과 크기(바이트) 모두에 씁니다."""
+
+    LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.35, 0.5, 0.75,
+                       1.0, 1.5, 2.5, 5.0, 10.0, 30.0)
+    SIZE_BUCKETS = tuple(float(4 ** i) for i in range(4, 14))  # 256B ~ 64MiB
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 마지막 칸은 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """q 분위수 추정치. 해당 버킷의 경계 사이를 선형 보간하며, +Inf 버킷이면 마지막 경계를 돌려줍니다."""
+        if self.count == 0:
+            return 0.0
+        cumulative = list(itertools.accumulate(self.counts))
+        rank = q * self.count
+        index = min(bisect.bisect_left(cumulative, rank), len(self.counts) - 1)
+        lower = self.buckets[index - 1] if index > 0 else 0.0
+        if index == len(self.buckets) or not self.counts[index]:
+            return lower if index < len(self.buckets) else self.buckets[-1]
+        below = cumulative[index] - self.counts[index]
+        return lower + (self.buckets[index] - lower) * (rank - below) / self.counts[index]
+
+
+class FetchMetrics:
+    """요청 단계별 시간과 응답 크기 히스토그램, 결과 카운터."""
+
+    STAGES = {
+        'queue_wait': "대기 (큐/호스트 슬롯/속도 제한)",
+        'dns': "DNS 조회",
+        'connect': "연결 (TCP/TLS)",
+        'ttfb': "첫 바이트까지",
+        'download': "본문 수신",
+        'parse': "JSON 파싱",
+        'total': "전체",
+    }
+
+    def __init__(self):
+        self.histograms = {stage: Histogram() for stage in self.STAGES}
+        self.sizes = Histogram(Histogram.SIZE_BUCKETS)
+        self.counters: Dict[str, int] = {}
+
+    def incr(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe_result(self, result: Dict[str, Any]):
+        """
+        결과 하나의 'timings'와 'bytes'를 히스토그램에 더합니다.
+        fetch_sharded()처럼 여러 프로세스에서 온 결과도 이 메서드로 모을 수 있습니다.
+        """
+        timings = result.get('timings', {})
+        for stage, histogram in self.histograms.items():
+            if stage in timings:
+                histogram.observe(timings[stage])
+        self.sizes.observe(result.get('bytes', 0))
+        self.incr('succeeded')
+        self.incr(f"cache_{result.get('cache', 'disabled')}")
+        if result.get('hedged'):
+            self.incr('hedged', result['hedged'])
+
+    def render_text(self) -> str:
+        lines = ["요청 단계별 통계 (p50 / p95 / p99, 횟수)"]
+        for stage, label in self.STAGES.items():
+            histogram = self.histograms[stage]
+            if histogram.count:
+                lines.append(
+                    f"- {label}: {histogram.quantile(0.5) * 1000:.1f} / {histogram.quantile(0.95) * 1000:.1f} / "
+                    f"{histogram.quantile(0.99) * 1000:.1f}ms ({histogram.count}회)"
+                )
+        if self.sizes.count:
+            lines.append(
+                f"- 응답 크기: p50 {self.sizes.quantile(0.5) / 1024:.1f}KiB, p99 {self.sizes.quantile(0.99) / 1024:.1f}KiB, "
+                f"합계 {self.sizes.sum / 1024 / 1024:.1f}MiB"
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"- {name}: {value}")
+        return "\n".join(lines)
+
+
+def _timing_trace_config() -> aiohttp.TraceConfig:
+    """DNS 조회와 새 연결 생성 시각을 요청별 trace_request_ctx(dict)에 기록하는 TraceConfig."""
+    trace_config = aiohttp.TraceConfig()
+
+    def mark(name: str):
+        async def on_event(session, context, params):
+            if isinstance(context.trace_request_ctx, dict):
+                context.trace_request_ctx[name] = time.monotonic()
+        return on_event
+
+    trace_config.on_dns_resolvehost_start.append(mark('dns_start'))
+    trace_config.on_dns_resolvehost_end.append(mark('dns_end'))
+    trace_config.on_connection_create_start.append(mark('connect_start'))
+    trace_config.on_connection_create_end.append(mark('connect_end'))
+    return trace_config
+
+
 class AsyncDataFetcher:
     """
     여러 URL로부터 데이터를 비동기적으로 수집하는 클래스.
     동시 요청 수를 제어하여 서버 부하를 조절합니다.
     """
 
-    def __init__(self, urls: List[str], max_concurrent_requests: int = 5):
+    # 한도 정보를 기억해 둘 최대 호스트 수 (넘으면 쉬고 있는 호스트부터 잊음)
+    MAX_TRACKED_HOSTS = 10000
+
+    def __init__(
+        self,
+        urls: Optional[UrlSource] = None,
+        max_concurrent_requests: int = 5,
+        *,
+        per_host_limit: Optional[int] = None,
+        max_per_host: Optional[int] = None,
+        adaptive: bool = True,
+        latency_factor: Optional[float] = None,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 300,
+        max_pending: Optional[int] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limit: Optional[float] = None,
+        rate_burst: int = 1,
+        host_rate_limits: Optional[Dict[str, float]] = None,
+        connect_timeout: Optional[float] = 5.0,
+        read_timeout: Optional[float] = 10.0,
+        total_timeout: Optional[float] = 30.0,
+        hedge_after: Optional[float] = None,
+        decode_offload_bytes: int = 1024 * 1024,
+        raw: bool = False,
+        log_sample_rate: float = 0.01,
+        cache: Optional[ResponseCache] = None,
+    ):
         """
         초기화 메서드
-        :param urls: 데이터를 가져올 URL 목록
+        :param urls: 데이터를 가져올 URL 목록. 리스트/튜플/집합은 미리 검사하고 중복을 제거하며,
+                     제너레이터나 비동기 이터러블은 stream()에서 하나씩 꺼내 씁니다 (중복 제거 없음).
         :param max_concurrent_requests: 동시에 실행할 최대 요청 수
+        :param per_host_limit: 호스트별 동시 요청 수의 시작값 (기본값: max_per_host). 과부하가 보이면 AIMD로 줄어듭니다.
+        :param max_per_host: 호스트별 동시 요청 수의 상한 (기본값: max_concurrent_requests)
+        :param adaptive: True면 429/503/타임아웃에 따라 호스트별 한도를 AIMD로 조절
+        :param latency_factor: 설정하면 첫 바이트까지의 시간이 그 호스트에서 본 가장 빠른 값의 이 배수를 넘을 때도
+                               과부하로 보고 한도를 줄입니다 (예: 3.0). None이면 응답 시간은 보지 않습니다.
+        :param keepalive_timeout: 쉬고 있는 keep-alive 연결을 유지할 시간 (초)
+        :param dns_cache_ttl: DNS 조회 결과를 캐시할 시간 (초, None이면 만료 없음)
+        :param max_pending: 호스트별 대기 큐에 담아 둘 최대 URL 수 (기본값: max_concurrent_requests의 10배)
+        :param retry_policy: 재시도 정책 (기본값: RetryPolicy())
+        :param rate_limit: 호스트별 초당 최대 요청 수 (None이면 제한 없음)
+        :param rate_burst: 토큰 버킷에 쌓일 수 있는 최대 토큰 수
+        :param host_rate_limits: 특정 호스트만 다른 초당 요청 수를 쓰고 싶을 때 {호스트: 초당 요청 수}
+        :param connect_timeout: 연결(DNS 조회 포함) 제한 시간 (초)
+        :param read_timeout: 소켓에서 다음 데이터를 기다리는 제한 시간 (초)
+        :param total_timeout: 요청 한 번 전체의 제한 시간 (초)
+        :param hedge_after: 설정하면 이 시간(초) 안에 응답이 없을 때 같은 요청을 하나 더 보내 먼저 온 응답을 씁니다
+        :param decode_offload_bytes: 이보다 큰 응답 본문은 executor 스레드에서 JSON 디코딩
+        :param raw: True면 JSON 디코딩을 건너뛰고 'data' 대신 'body'에 응답 본문 바이트를 담습니다
+                    (NDJSONSink 등은 디코딩 없이 그대로 기록). 본문은 JSON 값처럼 시작하고 끝나는지만 확인하며
+                    (_check_raw_json), 어긋나면 실패로 처리합니다. 그 밖의 문법 오류는 검사하지 않습니다.
+        :param log_sample_rate: 요청마다 남기는 완료 로그 중 실제로 남길 비율 (0이면 끔, 1이면 전부).
+                                실패/재시도 로그는 항상 남깁니다. 전체 통계는 self.metrics에 모입니다.
+        :param cache: 응답 캐시. 주면 결과의 'cache'에 hit(요청 생략)/revalidated(304)/miss가 기록되고,
+                      없으면 'disabled'입니다. 캐시는 호출한 쪽에서 close() 합니다.
         """
-        self.urls = self._validate_urls(urls)
+        if urls is None:
+            self.urls: UrlSource = []
+        elif isinstance(urls, (list, tuple, set, frozenset)):
+            self.urls = self._validate_urls(urls)
+        else:
+            self.urls = urls
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_per_host = max_per_host or max_concurrent_requests
+        self.per_host_limit = per_host_limit or self.max_per_host
+        self.adaptive = adaptive
+        self.latency_factor = latency_factor
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.max_pending = max_pending or max_concurrent_requests * 10
+        self.host_limits: Dict[str, AdaptiveHostLimit] = {}
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.host_rate_limits = {host.lower(): rate for host, rate in (host_rate_limits or {}).items()}
+        self.rate_buckets: Dict[str, TokenBucket] = {}
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout, sock_read=read_timeout)
+        self.hedge_after = hedge_after
+        self.decode_offload_bytes = decode_offload_bytes
+        self.raw = raw
+        self.log_sample_rate = log_sample_rate
+        self.metrics = FetchMetrics()
+        self.cache = cache
         # Semaphore를 사용하여 동시 실행 작업 수를 제어
         self.semaphore = asyncio.Semaphore(max_concurrent_requests)
         self.results: List[Dict[str, Any]] = []
         self.session: Optional[aiohttp.ClientSession] = None
 
-    def _validate_urls(self, urls: List[str]) -> List[str]:
+    @staticmethod
+    def _is_valid_url(url: str) -> bool:
+        if urlparse(url).scheme in ['http', 'https']:
+            return True
+        logging.warning(f"유효하지 않은 URL 형식입니다: {url}")
+        return False
+
+    def _validate_urls(self, urls: Iterable[str]) -> List[str]:
         """URL 유효성을 검사하고 중복을 제거합니다."""
         valid_urls = set()
         for url in urls:
-            if urlparse(url).scheme in ['http', 'https']:
+            if self._is_valid_url(url):
                 valid_urls.add(url)
-            else:
-                logging.warning(f"유효하지 않은 URL 형식입니다: {url}")
         return list(valid_urls)
 
-    async def _fetch_one(self, url: str) -> Optional[Dict[str, Any]]:
+    def _host_limit(self, host: str) -> AdaptiveHostLimit:
+        limit = self.host_limits.get(host)
+        if limit is None:
+            if len(self.host_limits) >= self.MAX_TRACKED_HOSTS:
+                for idle_host in [h for h, l in self.host_limits.items() if l.in_flight == 0]:
+                    del self.host_limits[idle_host]
+            limit = AdaptiveHostLimit(
+                min(self.per_host_limit, self.max_per_host), 1, self.max_per_host, self.adaptive, self.latency_factor
+            )
+            self.host_limits[host] = limit
+        return limit
+
+    def _rate_bucket(self, host: str) -> Optional[TokenBucket]:
+        rate = self.host_rate_limits.get(host, self.rate_limit)
+        if not rate:
+            return None
+        bucket = self.rate_buckets.get(host)
+        if bucket is None:
+            if len(self.rate_buckets) >= self.MAX_TRACKED_HOSTS:
+                self.rate_buckets.clear()  # 다시 만들어지면 가득 찬 버킷에서 시작할 뿐이므로 통째로 비움
+            bucket = TokenBucket(rate, self.rate_burst)
+            self.rate_buckets[host] = bucket
+        return bucket
+
+    def _make_session(self) -> aiohttp.ClientSession:
+        """
+        keep-alive 커넥션 풀과 DNS 캐시를 설정한 세션을 만듭니다.
+        hedge_after가 있으면 헤지 요청이 느린 첫 요청이 연결을 돌려줄 때까지 기다리지 않도록 풀 한도를 두 배로 잡습니다.
+        """
+        room = 2 if self.hedge_after is not None else 1
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrent_requests * room,
+            limit_per_host=self.max_per_host * room,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        return aiohttp.ClientSession(connector=connector, trace_configs=[_timing_trace_config()])
+
+    async def _cache_call(self, method, *args):
+        """
+        SQLite 캐시 조회/저장은 블로킹이므로 executor에서 실행합니다.
+        캐시가 망가져도 수집은 계속되도록 에러는 로그만 남기고 None을 돌려줍니다.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, method, *args)
+        except sqlite3.Error as e:
+            logging.warning(f"캐시 처리 실패: {args[0]} - {e}")
+            return None
+
+    async def _decode(self, body: bytes) -> Any:
+        """
+        본문을 JSON으로 디코딩합니다. orjson이 설치돼 있으면 그것을 쓰고,
+        decode_offload_bytes보다 큰 본문은 executor에서 디코딩해 이벤트 루프가 다른 요청을 계속 처리하게 합니다.
+        """
+        if not body or body.isspace():
+            return None
+        if len(body) >= self.decode_offload_bytes:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, _json_loads, body)
+        return _json_loads(body)
+
+    async def _timed_decode(self, result: Dict[str, Any], body: bytes, timings: Dict[str, float]) -> Dict[str, Any]:
+        """
+        본문을 디코딩해 result['data']에 넣고, 네트워크 시간과 파싱 시간을 따로 기록합니다.
+        raw 모드면 디코딩하지 않고 result['body']에 바이트를 그대로 넣습니다.
+        """
+        started = time.monotonic()
+        if self.raw:
+            result['body'] = _check_raw_json(body)
+        else:
+            result['data'] = await self._decode(body)
+        timings['parse'] = time.monotonic() - started
+        result['timings'] = timings
+        result['bytes'] = len(body)
+        return result
+
+    async def _request(self, url: str, host_limit: AdaptiveHostLimit,
+                       cached: Optional[CachedResponse] = None) -> Dict[str, Any]:
+        """
+        요청 한 번. 재시도할 만한 실패는 RetryableStatusError/타임아웃/연결 오류로 올립니다.
+        만료된 캐시 항목이 있으면 조건부 요청을 보내고, 304면 저장된 본문을 씁니다.
+        본문은 바이트로 다 받은 뒤(커넥션 반환 후) 디코딩합니다.
+        """
+        trace: Dict[str, float] = {}
+        started = time.monotonic()
+        headers = cached.conditional_headers() if cached else None
+        async with self.session.get(url, timeout=self.timeout, headers=headers, trace_request_ctx=trace) as response:
+            headers_at = time.monotonic()
+            if response.status in OVERLOAD_STATUSES:
+                host_limit.on_overload()
+            if response.status in self.retry_policy.retry_statuses:
+                raise RetryableStatusError(response.status, _parse_retry_after(response.headers.get('Retry-After')))
+            not_modified = response.status == 304 and cached is not None
+            if not not_modified:
+                response.raise_for_status()  # 200번대 상태 코드가 아니면 예외 발생
+                if 'json' not in response.content_type:
+                    raise aiohttp.ContentTypeError(
+                        response.request_info, response.history, status=response.status,
+                        message=f"JSON이 아닌 응답입니다: {response.content_type}", headers=response.headers,
+                    )
+                body = await response.read()
+            status, response_headers = response.status, response.headers
+        network = time.monotonic() - started
+        host_limit.on_success(headers_at - started)
+        # DNS/연결 시간은 새 연결을 만들 때만 있고, keep-alive 연결을 재사용하면 0
+        dns = trace.get('dns_end', 0.0) - trace.get('dns_start', 0.0)
+        connect = trace.get('connect_end', 0.0) - trace.get('connect_start', 0.0) - dns
+        timings = {
+            'dns': dns,
+            'connect': max(0.0, connect),
+            'ttfb': headers_at - started,
+            'download': network - (headers_at - started),
+            'network': network,
+        }
+
+        if not_modified:
+            result = {'url': url, 'status': cached.status, 'cache': 'revalidated'}
+            try:
+                result = await self._timed_decode(result, cached.body, timings)
+            except Exception:
+                await self._cache_call(self.cache.delete, url)  # 읽을 수 없는 항목은 다시 쓰지 않도록 지움
+                raise
+            ttl = self.cache.ttl_for(response_headers)
+            if ttl is None:
+                await self._cache_call(self.cache.delete, url)
+            else:
+                await self._cache_call(self.cache.refresh, url, response_headers, ttl)
+            return result
+
+        result = {'url': url, 'status': status, 'cache': 'disabled' if self.cache is None else 'miss'}
+        # 디코딩에 성공한 본문만 캐시에 저장
+        result = await self._timed_decode(result, body, timings)
+        if self.cache is not None:
+            ttl = self.cache.ttl_for(response_headers)
+            if ttl is not None:
+                await self._cache_call(self.cache.put, url, status, body, response_headers, ttl)
+            elif cached is not None:
+                await self._cache_call(self.cache.delete, url)
+        return result
+
+    async def _attempt(self, url: str, host_limit: AdaptiveHostLimit, bucket: Optional[TokenBucket],
+                       counts: Dict[str, int], cached: Optional[CachedResponse] = None) -> Dict[str, Any]:
+        """
+        요청을 보내고, hedge_after초 안에 응답이 없으면 같은 요청을 하나 더 보내 먼저 끝난 쪽을 씁니다.
+        (토큰 버킷에 여유가 없으면 추가 요청은 보내지 않음)
+        """
+        counts['attempts'] += 1
+        primary = asyncio.ensure_future(self._request(url, host_limit, cached))
+        if self.hedge_after is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done or (bucket is not None and not bucket.try_acquire()):
+            return await primary
+
+        counts['attempts'] += 1
+        counts['hedged'] += 1
+        pending = {primary, asyncio.ensure_future(self._request(url, host_limit, cached))}
+        try:
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _log_sampled(self, level: int, msg: str, **fields):
+        """
+        요청마다 호출되는 핫 패스용 로그. log_sample_rate 비율만 key=value 형식으로 남기고,
+        필드는 extra={'event': ...}로도 넘겨 구조화된 로그 핸들러가 그대로 쓸 수 있게 합니다.
+        레벨이 꺼져 있거나 표본에서 빠지면 문자열 포매팅도 하지 않습니다.
+        """
+        if self.log_sample_rate <= 0 or not logging.getLogger().isEnabledFor(level):
+            return
+        if self.log_sample_rate < 1.0 and random.random() >= self.log_sample_rate:
+            return
+        logging.log(level, msg + " " + " ".join(f"{key}={value}" for key, value in fields.items()),
+                    extra={'event': fields})
+
+    def _finish(self, result: Dict[str, Any], queued_at: float) -> Dict[str, Any]:
+        """전체 소요 시간을 기록하고 통계와 표본 로그에 반영합니다."""
+        timings = result['timings']
+        timings['total'] = time.monotonic() - queued_at
+        self.metrics.observe_result(result)
+        self._log_sampled(
+            logging.INFO, "요청 완료", url=result['url'], status=result['status'], cache=result['cache'],
+            attempts=result['attempts'], bytes=result['bytes'],
+            queue_ms=round(timings['queue_wait'] * 1000, 1), ttfb_ms=round(timings.get('ttfb', 0.0) * 1000, 1),
+            total_ms=round(timings['total'] * 1000, 1),
+        )
+        return result
+
+    async def _fetch_one(self, url: str, queued_at: Optional[float] = None) -> Optional[Dict[str, Any]]:
         """
         하나의 URL에서 데이터를 가져오는 내부 메서드.
-        Semaphore를 사용하여 동시 요청 수를 제어합니다.
+        Semaphore를 사용하여 동시 요청 수를 제어하고, 응답 시간과 상태 코드를 호스트별 한도에 반영합니다.
+        일시적인 실패(타임아웃, 연결 오류, 429/5xx)는 retry_policy에 따라 재시도하며,
+        결과에는 시도 횟수('attempts')와 헤지 요청 수('hedged'), 캐시 상태('cache'),
+        단계별 시간('timings': queue_wait/dns/connect/ttfb/download/parse/total, 초)과 본문 크기('bytes')가 기록되고,
+        같은 값이 self.metrics 히스토그램에도 쌓입니다.
+        :param queued_at: URL이 대기 큐에 들어온 시각 (time.monotonic 기준). 대기 시간 계산에 씁니다.
         """
+        if queued_at is None:
+            queued_at = time.monotonic()
         async with self.semaphore:
-            logging.info(f"요청 시작: {url}")
+            host = _host_of(url)
+            host_limit = self._host_limit(host)
+            bucket = self._rate_bucket(host)
+            policy = self.retry_policy
+            counts = {'attempts': 0, 'hedged': 0}
+            cached = None
+            if self.cache is not None:
+                cached = await self._cache_call(self.cache.get, url)
+                if cached is not None and cached.is_fresh:
+                    try:
+                        result = {'url': url, 'status': cached.status, 'cache': 'hit', **counts}
+                        timings = {'queue_wait': time.monotonic() - queued_at, 'network': 0.0}
+                        return self._finish(await self._timed_decode(result, cached.body, timings), queued_at)
+                    except Exception as e:
+                        logging.error(f"캐시된 응답을 읽을 수 없습니다: {url} - {e}")
+                        await self._cache_call(self.cache.delete, url)
+                        self.metrics.incr('failed')
+                        return None
+            queue_wait = 0.0
+            for retry in range(policy.max_attempts):
+                retry_after = None
+                try:
+                    # self.session은 run 메서드에서 생성됨
+                    if not self.session:
+                        raise RuntimeError("ClientSession이 초기화되지 않았습니다.")
+                    if bucket is not None:
+                        await bucket.acquire()
+                    if retry == 0:
+                        queue_wait = time.monotonic() - queued_at
+                    result = await self._attempt(url, host_limit, bucket, counts, cached)
+                    result.update(counts)
+                    result['timings']['queue_wait'] = queue_wait
+                    return self._finish(result, queued_at)
+                except asyncio.TimeoutError:
+                    host_limit.on_overload()
+                    reason = "타임아웃 발생"
+                except RetryableStatusError as e:
+                    retry_after = e.retry_after
+                    reason = f"HTTP {e.status}"
+                except RETRYABLE_CLIENT_ERRORS as e:
+                    reason = f"연결 에러 발생 - {e}"
+                except aiohttp.ClientError as e:
+                    logging.error(f"클라이언트 에러 발생: {url} - {e}")
+                    self.metrics.incr('failed')
+                    return None
+                except Exception as e:
+                    logging.error(f"알 수 없는 에러 발생: {url} - {e}")
+                    self.metrics.incr('failed')
+                    return None
+
+                if retry + 1 >= policy.max_attempts:
+                    logging.error(f"{reason}: {url} (시도 {counts['attempts']}회 후 포기)")
+                    self.metrics.incr('failed')
+                    break
+                self.metrics.incr('retries')
+                delay = policy.delay(retry, retry_after)
+                logging.warning(f"{reason}: {url} - {delay:.2f}초 후 재시도 ({retry + 1}/{policy.max_attempts - 1})")
+                await asyncio.sleep(delay)
+            return None
+
+    async def stream(self, urls: Optional[UrlSource] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        결과를 완료되는 순서대로 하나씩 돌려주는 비동기 제너레이터.
+        URL을 하나씩 꺼내는 producer와 max_concurrent_requests개의 worker만 띄우고 큐 크기도 제한하므로,
+        URL이 수백만 개여도 메모리 사용량이 일정합니다.
+        worker는 호스트별 한도에 여유가 있는 URL부터 가져가므로 여러 호스트가 섞여 있어도 한 곳에 몰리지 않습니다.
+        리스트/튜플은 호스트끼리 번갈아 가며 큐에 넣으므로 호스트별로 몰려 있어도 됩니다. 제너레이터나 비동기 이터러블은
+        순서대로 max_pending개까지만 미리 읽으므로, 한 호스트의 URL이 길게 이어지면 그동안 다른 호스트의 URL은 기다립니다.
+
+            async for result in fetcher.stream():
+                ...
+
+        중간에 멈출 때는 contextlib.aclosing()으로 감싸면 남은 작업이 바로 정리됩니다.
+        :param urls: 생략하면 생성자에서 받은 URL을 사용합니다.
+        """
+        source = self.urls if urls is None else urls
+        if isinstance(source, (list, tuple)):
+            source = _interleave_hosts(source)
+        worker_count = self.max_concurrent_requests
+        url_queue = HostAwareQueue(self.max_pending, self._host_limit)
+        result_queue: asyncio.Queue = asyncio.Queue(maxsize=worker_count)
+
+        async def produce():
+            error = None
             try:
-                # self.session은 run 메서드에서 생성됨
-                if not self.session:
-                    raise RuntimeError("ClientSession이 초기화되지 않았습니다.")
-                
-                async with self.session.get(url, timeout=10) as response:
-                    response.raise_for_status()  # 200번대 상태 코드가 아니면 예외 발생
-                    data = await response.json()
-                    logging.info(f"요청 성공: {url}")
-                    return {'url': url, 'status': response.status, 'data': data}
-            except asyncio.TimeoutError:
-                logging.error(f"타임아웃 발생: {url}")
-            except aiohttp.ClientError as e:
-                logging.error(f"클라이언트 에러 발생: {url} - {e}")
+                async for url in _iter_urls(source):
+                    if self._is_valid_url(url):
+                        await url_queue.put(url)
             except Exception as e:
-                logging.error(f"알 수 없는 에러 발생: {url} - {e}")
-            return None
+                error = e
+            # 입력이 끝났거나 실패해도 worker들이 종료할 수 있도록 큐를 닫음
+            await url_queue.close()
+            if error is not None:
+                raise error
+
+        async def work():
+            error = None
+            try:
+                while True:
+                    item = await url_queue.get()
+                    if item is _DONE:
+                        break
+                    url, queued_at = item
+                    try:
+                        res = await self._fetch_one(url, queued_at)
+                    finally:
+                        await url_queue.release(url)
+                    if res is not None:
+                        await result_queue.put(res)
+            except Exception as e:
+                logging.error(f"worker 에러 발생: {e}")
+                error = e
+            # 실패해도 결과를 기다리는 쪽이 멈추지 않도록 끝났음을 알림
+            await result_queue.put(_DONE)
+            if error is not None:
+                raise error
+
+        # 외부에서 세션을 넣어 주지 않았으면 여기서 만들어 커넥션 풀을 재사용
+        own_session = self.session is None
+        if own_session:
+            self.session = self._make_session()
+        producer = asyncio.ensure_future(produce())
+        workers = [asyncio.ensure_future(work()) for _ in range(worker_count)]
+        try:
+            finished_workers = 0
+            while finished_workers < worker_count:
+                res = await result_queue.get()
+                if res is _DONE:
+                    finished_workers += 1
+                    continue
+                yield res
+            # URL 이터러블이나 worker에서 난 예외를 호출한 쪽으로 전달
+            await producer
+            for worker in workers:
+                await worker
+        finally:
+            for task in [producer, *workers]:
+                task.cancel()
+            await asyncio.gather(producer, *workers, return_exceptions=True)
+            if own_session:
+                await self.session.close()
+                self.session = None
+
+    async def export(self, sink: "ResultSink") -> int:
+        """
+        결과를 메모리에 모으지 않고 sink로 바로 내보냅니다. 끝나면 sink를 닫고 내보낸 결과 수를 돌려줍니다.
+        sink가 밀리면 결과 큐가 차서 worker도 새 요청을 멈춥니다.
+        """
+        start_time = time.time()
+        count = await drain(self.stream(), sink)
+        logging.info(f"데이터 수집 완료. {count}개 결과 기록, 총 소요 시간: {time.time() - start_time:.2f}초")
+        logging.info(self.metrics.render_text())
+        return count
 
     async def run(self) -> List[Dict[str, Any]]:
         """
         데이터 수집을 시작하는 메인 메서드.
+        모든 결과를 self.results에 모아 돌려줍니다. URL이 아주 많으면 stream()이나 export()를 사용하세요.
         """
         start_time = time.time()
-        logging.info(f"총 {len(self.urls)}개의 URL에 대한 데이터 수집을 시작합니다.")
-
-        # aiohttp.ClientSession을 생성하여 커넥션 풀을 재사용
-        async with aiohttp.ClientSession() as session:
-            self.session = session
-            # 각 URL에 대한 fetch 작업을 비동기 태스크(Task)로 만듭니다.
-            tasks = [self._fetch_one(url) for url in self.urls]
-            
-            # asyncio.gather를 사용하여 모든 태스크가 완료될 때까지 기다립니다.
-            # return_exceptions=True로 설정하면 예외가 발생해도 중단되지 않고 결과에 포함됩니다.
-            responses = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # 결과 처리
-        for res in responses:
-            if isinstance(res, dict) and res is not None:
-                self.results.append(res)
-            elif isinstance(res, Exception):
-                logging.warning(f"작업 중 예외가 결과에 포함되었습니다: {res}")
-        
+        if isinstance(self.urls, list):
+            logging.info(f"총 {len(self.urls)}개의 URL에 대한 데이터 수집을 시작합니다.")
+        else:
+            logging.info("URL 스트림에 대한 데이터 수집을 시작합니다.")
+
+        async for res in self.stream():
+            self.results.append(res)
+
         end_time = time.time()
         logging.info(f"데이터 수집 완료. 총 소요 시간: {end_time - start_time:.2f}초")
+        logging.info(self.metrics.render_text())
         return self.results
 
 
+_JSON_VALUE_START = frozenset(b'{["-0123456789tfn')
+_JSON_CLOSERS = {ord('{'): ord('}'), ord('['): ord(']'), ord('"'): ord('"')}
+
+
+def _check_raw_json(body: bytes) -> bytes:
+    """
+    raw 모드 본문을 디코딩하지 않고 겉모양만 확인합니다. 앞의 BOM은 떼어 내고,
+    JSON 값으로 시작하지 않거나 객체/배열/문자열이 닫히지 않은 본문(HTML 에러 페이지, 잘린 응답 등)은 ValueError.
+    겉모양만 보므로 중간의 문법 오류까지 잡지는 못합니다.
+    """
+    if body.startswith(b'\xef\xbb\xbf'):
+        body = body[3:]
+    stripped = body.strip()
+    if not stripped:
+        return body
+    if stripped[0] not in _JSON_VALUE_START:
+        raise ValueError(f"JSON 값으로 시작하지 않는 본문입니다: {stripped[:20]!r}")
+    closer = _JSON_CLOSERS.get(stripped[0])
+    if closer is not None and (len(stripped) < 2 or stripped[-1] != closer):
+        raise ValueError(f"닫히지 않은 JSON 본문입니다 (잘린 응답?): ...{stripped[-20:]!r}")
+    return body
+
+
+def _ndjson_line(result: Dict[str, Any]) -> bytes:
+    """
+    결과 하나를 NDJSON 한 줄로 만듭니다.
+    raw 모드 결과('body')는 디코딩하지 않고 본문 바이트를 "data" 자리에 그대로 이어 붙입니다.
+    JSON 문자열 안에는 줄바꿈이 그대로 들어갈 수 없으므로, 본문의 줄바꿈은 공백이라 바꿔도 안전합니다.
+    본문은 _check_raw_json의 겉모양 검사만 거쳤으므로, 서버가 잘못된 JSON을 보내면 그 줄도 잘못된 JSON이 됩니다.
+    """
+    body = result.get('body')
+    if body is None:
+        return _json_dumps(result) + b'\n'
+    meta = _json_dumps({k: v for k, v in result.items() if k != 'body'})
+    if not body or body.isspace():
+        body = b'null'
+    else:
+        body = body.replace(b'\n', b' ').replace(b'\r', b' ')
+    return meta[:-1] + b',"data":' + body + b'}\n'
+
+
+class ResultSink(abc.ABC):
+    """
+    결과를 내보내는 곳의 기본 클래스. 하위 클래스는 write()를 구현합니다.
+    write()가 기다리는 동안 fetch worker도 새 결과를 넘기지 못하고 기다리므로, 소비하는 쪽이 느리면 수집도 그만큼 느려집니다.
+    """
+
+    @abc.abstractmethod
+    async def write(self, result: Dict[str, Any]):
+        """결과 하나를 내보냅니다."""
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class CallbackSink(ResultSink):
+    """결과마다 callback(result)를 호출합니다. 코루틴 함수면 끝날 때까지 기다립니다."""
+
+    def __init__(self, callback: Callable[[Dict[str, Any]], Any]):
+        self.callback = callback
+
+    async def write(self, result: Dict[str, Any]):
+        ret = self.callback(result)
+        if inspect.isawaitable(ret):
+            await ret
+
+
+class QueueSink(ResultSink):
+    """
+    결과를 asyncio.Queue에 넣습니다. maxsize가 있는 큐를 주면 큐가 찼을 때 수집이 멈춥니다.
+    닫힐 때 끝을 알리는 None을 넣습니다.
+    """
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    async def write(self, result: Dict[str, Any]):
+        await self.queue.put(result)
+
+    async def close(self):
+        await self.queue.put(None)
+
+
+class NDJSONSink(ResultSink):
+    """
+    결과를 한 줄에 하나씩 JSON으로 파일에 덧붙입니다.
+    write()는 크기가 제한된 큐에 넣기만 하고, writer 태스크가 큐에 쌓인 결과를 batch_size개까지 묶어
+    executor 스레드에서 직렬화하고 한 번에 씁니다. 큐가 가득 차면 write()가 기다립니다.
+    """
+
+    def __init__(self, path: str, batch_size: int = 256, max_pending: int = 4096, buffer_size: int = 1024 * 1024):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.records = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._writer: Optional[asyncio.Future] = None
+        self._error: Optional[BaseException] = None
+        self._file = None
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'ab', buffering=self.buffer_size)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        if self._file is None:
+            self._open()
+        self._file.write(b''.join(_ndjson_line(result) for result in batch))
+        self.records += len(batch)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch[-1] is _DONE:
+                batch.pop()
+                finished = True
+            # 쓰기에 실패해도 write()가 막히지 않도록 큐는 계속 비움
+            if batch and self._error is None:
+                try:
+                    await loop.run_in_executor(None, self._write_batch, batch)
+                except Exception as e:
+                    self._error = e
+
+    async def write(self, result: Dict[str, Any]):
+        if self._error is not None:
+            raise self._error
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._run())
+        await self._queue.put(result)
+
+    async def close(self):
+        """남은 결과를 모두 쓰고 파일을 닫습니다."""
+        if self._writer is not None:
+            await self._queue.put(_DONE)
+            await self._writer
+            self._writer = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._close_file)
+        if self._error is not None:
+            raise self._error
+
+
+class RotatingNDJSONSink(NDJSONSink):
+    """
+    NDJSONSink와 같지만 파일 하나가 max_bytes(또는 max_records줄)를 넘으면 다음 파일로 넘어갑니다.
+    파일 이름은 path의 확장자 앞에 번호를 붙입니다 (results.ndjson -> results.00000.ndjson, results.00001.ndjson, ...).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, max_records: Optional[int] = None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.index = 0
+        self._file_bytes = 0
+        self._file_records = 0
+
+    def _open(self):
+        base, ext = os.path.splitext(self.path)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(f"{base}.{self.index:05d}{ext}", 'ab', buffering=self.buffer_size)
+        self.index += 1
+        self._file_bytes = self._file.tell()
+        self._file_records = 0
+
+    def _is_full(self, size: int) -> bool:
+        if self._file_bytes == 0:
+            return False
+        if self.max_records and self._file_records >= self.max_records:
+            return True
+        return self._file_bytes + size > self.max_bytes
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        if self._file is None:
+            self._open()
+        chunk = []
+        for result in batch:
+            line = _ndjson_line(result)
+            if self._is_full(len(line)):
+                self._file.write(b''.join(chunk))
+                chunk = []
+                self._close_file()
+                self._open()
+            chunk.append(line)
+            self._file_bytes += len(line)
+            self._file_records += 1
+        self._file.write(b''.join(chunk))
+        self.records += len(batch)
+
+
+async def drain(results: AsyncIterable[Dict[str, Any]], sink: ResultSink) -> int:
+    """
+    stream()이나 fetch_sharded()의 결과를 sink로 모두 내보내고 sink를 닫습니다. 내보낸 결과 수를 돌려줍니다.
+
+        async with contextlib.aclosing(fetch_sharded(urls, raw=True)) as results:
+            await drain(results, RotatingNDJSONSink("out/results.ndjson"))
+    """
+    count = 0
+    try:
+        async for result in results:
+            await sink.write(result)
+            count += 1
+    finally:
+        if hasattr(results, 'aclose'):
+            await results.aclose()
+        await sink.close()
+    return count
+
+
+# 샤드 프로세스가 입력 큐에서 URL 묶음을 기다리거나 결과 큐에 넣을 때 중단 여부를 확인하는 간격 (초)
+_SHARD_POLL_INTERVAL = 0.5
+
+
+def _shard_of(url: str, shards: int) -> int:
+    """같은 호스트는 항상 같은 샤드로 보내 호스트별 한도와 속도 제한이 프로세스 수만큼 늘어나지 않게 합니다."""
+    return zlib.crc32(_host_of(url).encode()) % shards
+
+
+def _split_host_limits(fetcher_kwargs: Dict[str, Any], shards: int) -> Dict[str, Any]:
+    """
+    by_host=False일 때 한 호스트가 모든 샤드로 흩어지므로, 호스트별 한도와 속도 제한을 샤드 수로 나눠
+    전체 합이 프로세스 하나일 때와 비슷하게 유지되도록 합니다.
+    """
+    kwargs = dict(fetcher_kwargs)
+    max_per_host = kwargs.get('max_per_host') or kwargs.get('max_concurrent_requests', 5)
+    kwargs['max_per_host'] = max(1, -(-max_per_host // shards))
+    if kwargs.get('per_host_limit'):
+        kwargs['per_host_limit'] = max(1, -(-kwargs['per_host_limit'] // shards))
+    if kwargs.get('rate_limit'):
+        kwargs['rate_limit'] = kwargs['rate_limit'] / shards
+    if kwargs.get('host_rate_limits'):
+        kwargs['host_rate_limits'] = {host: rate / shards for host, rate in kwargs['host_rate_limits'].items()}
+    if kwargs.get('rate_burst'):
+        kwargs['rate_burst'] = max(1, -(-kwargs['rate_burst'] // shards))
+    return kwargs
+
+
+def _shard_main(index: int, in_queue, out_queue, fetcher_kwargs: Dict[str, Any]):
+    """
+    샤드 프로세스의 진입점. 자신의 이벤트 루프와 세션으로 AsyncDataFetcher.stream()을 돌리고,
+    결과를 하나씩 out_queue에 넣은 뒤 마지막에 ('done', index, 에러 메시지 또는 None)을 넣습니다.
+    """
+    async def urls():
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(None, in_queue.get)
+            if batch is None:
+                return
+            for url in batch:
+                yield url
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        fetcher = AsyncDataFetcher(urls(), **fetcher_kwargs)
+        async for res in fetcher.stream():
+            # out_queue가 가득 차면(부모가 못 따라오면) 여기서 기다리므로 worker도 함께 멈춤
+            await loop.run_in_executor(None, out_queue.put, ('result', res))
+
+    error = None
+    try:
+        asyncio.run(main())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    out_queue.put(('done', index, error))
+
+
+async def fetch_sharded(
+    urls: UrlSource,
+    shards: Optional[int] = None,
+    batch_size: int = 100,
+    by_host: bool = True,
+    **fetcher_kwargs,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    URL을 여러 프로세스에 나눠 가져오고 결과를 완료되는 순서대로 하나씩 돌려주는 비동기 제너레이터.
+    각 프로세스는 자신의 이벤트 루프와 ClientSession을 가지므로 JSON 디코딩이 여러 코어에 나뉩니다.
+    입력/결과 큐 모두 크기가 제한되어 URL이 아무리 많아도 메모리가 일정합니다.
+
+    샤드 배정 방식 (by_host):
+    - True(기본값): 같은 호스트는 항상 같은 샤드로 갑니다. 호스트별 한도, AIMD, 속도 제한이 정확히 지켜지지만
+      호스트가 하나뿐이거나 적으면 그만큼의 프로세스만 일하므로 디코딩이 여러 코어에 나뉘지 않습니다.
+    - False: URL을 샤드에 돌아가며 나눠 줍니다. 호스트가 적어도 모든 코어를 쓰는 대신, 호스트별 한도와
+      속도 제한(max_per_host, per_host_limit, rate_limit, rate_burst, host_rate_limits)을 샤드 수로 나눠 적용하며
+      AIMD는 샤드마다 따로 동작합니다.
+
+        async for result in fetch_sharded(urls, shards=4, max_concurrent_requests=20):
+            ...
+
+    spawn 방식으로 프로세스를 만들므로 스크립트에서 호출할 때는 if __name__ == "__main__": 안에서 실행해야 합니다.
+    :param urls: URL 이터러블 또는 비동기 이터러블
+    :param shards: 프로세스 수 (기본값: CPU 코어 수)
+    :param batch_size: 샤드에 URL을 넘길 때 한 번에 묶는 개수
+    :param by_host: 호스트 기준으로 샤드를 정할지 여부 (위 설명 참고)
+    :param fetcher_kwargs: 각 샤드의 AsyncDataFetcher에 넘길 인자 (max_concurrent_requests, retry_policy, cache 등).
+                           max_concurrent_requests는 샤드마다 적용됩니다.
+    """
+    shards = shards or os.cpu_count() or 1
+    if isinstance(urls, (list, tuple)):
+        urls = _interleave_hosts(urls)  # 호스트별로 몰린 목록이 한 샤드의 입력 큐만 채우지 않도록
+    if not by_host:
+        fetcher_kwargs = _split_host_limits(fetcher_kwargs, shards)
+    ctx = multiprocessing.get_context('spawn')
+    in_queues = [ctx.Queue(maxsize=4) for _ in range(shards)]
+    out_queue = ctx.Queue(maxsize=shards * fetcher_kwargs.get('max_concurrent_requests', 5) * 2)
+    processes = [
+        ctx.Process(target=_shard_main, args=(i, in_queues[i], out_queue, fetcher_kwargs),
+                    name=f"fetch-shard-{i}", daemon=True)
+        for i in range(shards)
+    ]
+    for process in processes:
+        process.start()
+
+    loop = asyncio.get_running_loop()
+    stopping = threading.Event()
+
+    def put_blocking(q, item):
+        # 샤드가 죽거나 중단되면 영원히 막히지 않도록 주기적으로 확인
+        while not stopping.is_set():
+            try:
+                q.put(item, timeout=_SHARD_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def get_blocking():
+        try:
+            return out_queue.get(timeout=_SHARD_POLL_INTERVAL)
+        except queue.Empty:
+            return None
+
+    async def produce():
+        batches: List[List[str]] = [[] for _ in range(shards)]
+        sent = 0
+        async for url in _iter_urls(urls):
+            if not AsyncDataFetcher._is_valid_url(url):
+                continue
+            index = _shard_of(url, shards) if by_host else sent % shards
+            sent += 1
+            batches[index].append(url)
+            if len(batches[index]) >= batch_size:
+                await loop.run_in_executor(None, put_blocking, in_queues[index], batches[index])
+                batches[index] = []
+        for index in range(shards):
+            if batches[index]:
+                await loop.run_in_executor(None, put_blocking, in_queues[index], batches[index])
+            await loop.run_in_executor(None, put_blocking, in_queues[index], None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        finished = set()
+        while len(finished) < shards:
+            message = await loop.run_in_executor(None, get_blocking)
+            if message is None:
+                if producer.done() and producer.exception() is not None:
+                    raise producer.exception()
+                for i, process in enumerate(processes):
+                    if i not in finished and not process.is_alive():
+                        raise RuntimeError(f"샤드 {i} 프로세스가 비정상 종료되었습니다 (exit code {process.exitcode})")
+                continue
+            if message[0] == 'result':
+                yield message[1]
+                continue
+            _, index, error = message
+            if error is not None:
+                raise RuntimeError(f"샤드 {index} 실패: {error}")
+            finished.add(index)
+        await producer  # URL 이터러블에서 난 예외를 호출한 쪽으로 전달
+    finally:
+        stopping.set()
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
+        for q in [*in_queues, out_queue]:
+            q.cancel_join_thread()
+            q.close()
+
+
 # --- 코드 실행 부분 ---
 if __name__ == "__main__":
     # 테스트용 공개 API (JSONPlaceholder)
@@ -110,8 +1445,10 @@ if __name__ == "__main__":
     sample_urls.extend([
         "https://jsonplaceholder.typicode.com/posts/1", # 중복 URL
         "https://invalid-url-for-testing.com", # 잘못된 URL
-        f"https://jsonplaceholder.typicode.com/comments/{i}" for i in range(1, 11)
     ])
+    sample_urls.extend(
+        f"https://jsonplaceholder.typicode.com/comments/{i}" for i in range(1, 11)
+    )
 
     # 1. 클래스 인스턴스 생성
     # 최대 7개의 요청을 동시에 처리하도록 설정